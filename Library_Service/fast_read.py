@@ -0,0 +1,115 @@
+"""Fast read path for list endpoints.
+
+DRF serializes every object by walking its fields, resolving attributes and
+dispatching ``to_representation`` per value. For flat serializers the same
+output can be built straight from ``QuerySet.values()`` rows with one
+precomputed conversion per field. The plan is derived once per serializer
+class from the serializer's own fields, so the output stays identical;
+serializers with fields it does not understand keep the regular path.
+"""
+
+import decimal
+from functools import lru_cache
+
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+
+
+def _date_converter(field):
+    output_format = getattr(field, "format", api_settings.DATE_FORMAT)
+    if output_format is None:
+        return None
+    if output_format.lower() == ISO_8601:
+        return lambda value: value.isoformat()
+    return lambda value: value.strftime(output_format)
+
+
+def _decimal_converter(field):
+    coerce_to_string = getattr(
+        field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING
+    )
+    if not coerce_to_string or field.localize or field.normalize_output:
+        return field.to_representation
+    if field.decimal_places is None:
+        return field.to_representation
+
+    exponent = decimal.Decimal(".1") ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        return f"{value.quantize(exponent, rounding=rounding, context=context):f}"
+
+    return convert
+
+
+def _field_converter(field):
+    """Return ``(supported, converter)``; a ``None`` converter means as-is."""
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        return field.pk_field is None, None
+    if isinstance(field, serializers.DecimalField):
+        return True, _decimal_converter(field)
+    if isinstance(field, serializers.DateTimeField):
+        return False, None
+    if isinstance(field, serializers.DateField):
+        return True, _date_converter(field)
+    if isinstance(field, serializers.ChoiceField):
+        return True, None
+    if isinstance(field, (serializers.CharField, serializers.IntegerField)):
+        return True, None
+    return False, None
+
+
+class ReadPlan:
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.sources = tuple(source for _, source, _ in self.fields)
+
+    def to_representation(self, row):
+        ret = {}
+        for name, source, converter in self.fields:
+            value = row[source]
+            if converter is not None and value is not None:
+                value = converter(value)
+            ret[name] = value
+        return ret
+
+    def to_representation_many(self, rows):
+        to_representation = self.to_representation
+        return [to_representation(row) for row in rows]
+
+
+@lru_cache(maxsize=None)
+def get_read_plan(serializer_class):
+    """Build a ``ReadPlan`` for ``serializer_class`` or ``None`` if unsupported."""
+    fields = []
+    for field in serializer_class().fields.values():
+        if field.write_only:
+            continue
+        if len(field.source_attrs) != 1:
+            return None
+        supported, converter = _field_converter(field)
+        if not supported:
+            return None
+        fields.append((field.field_name, field.source, converter))
+    return ReadPlan(fields)
+
+
+class FastReadListMixin:
+    """Serve ``list`` from ``values()`` rows whenever the serializer allows it."""
+
+    def list(self, request, *args, **kwargs):
+        plan = get_read_plan(self.get_serializer_class())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).values(*plan.sources)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.to_representation_many(page))
+
+        return Response(plan.to_representation_many(queryset))
@@ -0,0 +1,20 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset pagination over the primary key, newest first.
+
+    The opaque cursor carries the last seen id, so each page is an indexed
+    range scan (``WHERE id < %s ORDER BY id DESC LIMIT n``) and deep pages
+    cost the same as the first one.
+    """
+
+    ordering = "-id"
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class BookSearchPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
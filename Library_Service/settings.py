@@ -47,6 +47,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework.authtoken",
     "debug_toolbar",
@@ -54,6 +55,7 @@ INSTALLED_APPS = [
     "user",
     "service_borrowing",
     "service_payments",
+    "notifications",
     "drf_spectacular",
 ]
 
@@ -91,12 +93,63 @@ WSGI_APPLICATION = "Library_Service.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+if os.getenv("DATABASE") == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("POSTGRES_DB"),
+            "USER": os.getenv("POSTGRES_USER"),
+            "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
+            "HOST": os.getenv("POSTGRES_HOST", "localhost"),
+            "PORT": os.getenv("POSTGRES_PORT", "5432"),
+            "OPTIONS": {
+                # Milliseconds; a runaway query is cancelled instead of
+                # holding a connection and its locks indefinitely.
+                "options": "-c statement_timeout={}".format(
+                    env.int("POSTGRES_STATEMENT_TIMEOUT", default=30000)
+                ),
+            },
+        }
     }
-}
+    if env.bool("POSTGRES_POOL", default=True):
+        # A psycopg connection pool per process instead of a new connection
+        # per request; pooling requires CONN_MAX_AGE to stay 0.
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": env.int("POSTGRES_POOL_MIN_SIZE", default=2),
+            "max_size": env.int("POSTGRES_POOL_MAX_SIZE", default=10),
+            "timeout": env.int("POSTGRES_POOL_TIMEOUT", default=10),
+        }
+    else:
+        DATABASES["default"]["CONN_MAX_AGE"] = env.int("CONN_MAX_AGE", default=60)
+        DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            # Writers queue on the database lock for up to ``timeout``
+            # seconds instead of failing with "database is locked".
+            "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
+            # A file, unlike the default in-memory database, can be shared
+            # by the threads of the concurrency tests.
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
+        }
+    }
+
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+THROTTLE_REDIS_URL = os.getenv("THROTTLE_REDIS_URL", REDIS_URL)
 
 
 # Password validation
@@ -145,15 +198,23 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "user.authentication.CachedJWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_PAGINATION_CLASS": "Library_Service.pagination.IdCursorPagination",
+    "PAGE_SIZE": 20,
     "DEFAULT_THROTTLE_CLASSES": [
-        "rest_framework.throttling.AnonRateThrottle",
-        "rest_framework.throttling.UserRateThrottle",
+        "Library_Service.throttling.ActionScopedRedisThrottle"
     ],
-    "DEFAULT_THROTTLE_RATES": {"anon": "10/minute", "user": "30/minute"},
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": "10/minute",
+        "user": "30/minute",
+        "catalog": "120/minute",
+        "borrow_create": "10/minute",
+        "login": "5/minute",
+        "payment_callback": "300/minute",
+    },
 }
 
 SPECTACULAR_SETTINGS = {
@@ -174,15 +235,43 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
     "ROTATE_REFRESH_TOKENS": False,
 }
+# Seconds an authenticated user is served from the cache.
+AUTH_USER_CACHE_TIMEOUT = 60
 
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 
-if STRIPE_SECRET_KEY:
-    import stripe
+STRIPE_FAKE = env.bool("STRIPE_FAKE", default=False)
 
-    stripe.api_key = STRIPE_SECRET_KEY
+if STRIPE_FAKE:
+    PAYMENT_GATEWAY = {
+        "BACKEND": "service_payments.gateways.FakeGateway",
+        "OPTIONS": {
+            "latency": env.float("FAKE_GATEWAY_LATENCY", default=0.0),
+            "failure_rate": env.float("FAKE_GATEWAY_FAILURE_RATE", default=0.0),
+        },
+    }
 else:
-    print("WARNING: STRIPE_SECRET_KEY not found in .env file.")
+    PAYMENT_GATEWAY = {
+        "BACKEND": "service_payments.gateways.StripeGateway",
+        "OPTIONS": {
+            "connect_timeout": 2.0,
+            "read_timeout": 10.0,
+            "max_network_retries": 2,
+            "pool_size": 20,
+            "failure_threshold": 5,
+            "reset_timeout": 30.0,
+        },
+    }
+    if not STRIPE_SECRET_KEY:
+        print("WARNING: STRIPE_SECRET_KEY not found in .env file.")
+
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+# Sent to Stripe as the session's expires_at, which must be within 24 hours
+# of its creation; the hour short of that absorbs clock skew.
+STRIPE_CHECKOUT_SESSION_LIFETIME = timedelta(hours=23)
+# How long after its expiry a session is left for late webhooks and
+# in-flight payments before the payment is expired and its copy released.
+STRIPE_CHECKOUT_EXPIRY_GRACE = timedelta(hours=1)
 
 FINE_MULTIPLIER = 2
 
@@ -196,9 +285,73 @@ CELERY_TIMEZONE = "Europe/Kiev"
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
+NOTIFICATION_REDIS_URL = os.getenv("NOTIFICATION_REDIS_URL", CELERY_BROKER_URL)
+# Seconds a notification may wait to be merged with others into a digest.
+NOTIFICATION_DIGEST_WINDOW = 10
+NOTIFICATION_DIGEST_MAX_MESSAGES = 50
+# Shared by all workers; Telegram allows about 20 messages a minute per group.
+NOTIFICATION_SEND_RATE = 20 / 60
+NOTIFICATION_SEND_BURST = 5
+# Seconds after which messages claimed by a flush that never finished are
+# put back in the buffer.
+NOTIFICATION_CLAIM_TIMEOUT = 300
+# Seconds before a digest a backend failed to send is tried again.
+NOTIFICATION_RETRY_DELAY = 60
+
+NOTIFICATION_BACKENDS = {
+    "telegram": {"BACKEND": "notifications.backends.TelegramBackend"},
+    "email": {
+        "BACKEND": "notifications.backends.EmailBackend",
+        "OPTIONS": {"recipients": env.list("NOTIFICATION_EMAILS", default=[])},
+    },
+    "locmem": {"BACKEND": "notifications.backends.LocMemBackend"},
+}
+if os.getenv("NOTIFICATION_WEBHOOK_URL"):
+    NOTIFICATION_BACKENDS["webhook"] = {
+        "BACKEND": "notifications.backends.WebhookBackend",
+        "OPTIONS": {"url": os.getenv("NOTIFICATION_WEBHOOK_URL")},
+    }
+if os.getenv("NOTIFICATION_FILE"):
+    NOTIFICATION_BACKENDS["file"] = {
+        "BACKEND": "notifications.backends.FileBackend",
+        "OPTIONS": {"path": os.getenv("NOTIFICATION_FILE")},
+    }
+# Backends per notification kind; kinds without an entry use "default".
+NOTIFICATION_ROUTES = {
+    "default": env.list("NOTIFICATION_DEFAULT_BACKENDS", default=["telegram"]),
+}
+NOTIFICATION_FANOUT_WORKERS = 8
+
+OUTBOX_RETENTION = timedelta(days=7)
+OVERDUE_REMINDER_RETENTION = timedelta(days=30)
+
 CELERY_BEAT_SCHEDULE = {
     "check_overdue_borrowings_daily": {
         "task": "notifications.tasks.check_overdue_borrowings",
         "schedule": crontab(hour=9, minute=0),
     },
+    "send_overdue_reminders_daily": {
+        "task": "notifications.tasks.send_overdue_reminders",
+        "schedule": crontab(hour=9, minute=0),
+    },
+    "expire_stale_payments": {
+        "task": "service_payments.tasks.expire_stale_payments",
+        "schedule": crontab(minute="*/15"),
+    },
+    "flush_notifications": {
+        "task": "notifications.tasks.flush_notifications",
+        "schedule": crontab(minute="*/5"),
+    },
+    "dispatch_outbox": {
+        "task": "notifications.tasks.dispatch_outbox",
+        "schedule": timedelta(seconds=2),
+    },
+    "purge_outbox_daily": {
+        "task": "notifications.tasks.purge_outbox",
+        "schedule": crontab(hour=3, minute=0),
+    },
+    "purge_overdue_reminders_daily": {
+        "task": "notifications.tasks.purge_overdue_reminders",
+        "schedule": crontab(hour=3, minute=30),
+    },
 }
@@ -0,0 +1,137 @@
+"""Request throttling shared by every worker through Redis.
+
+DRF's throttles keep a list of request timestamps per client in the cache,
+read and written back in two round trips, so concurrent requests can all
+slip through. Here each check is one Lua script implementing GCRA (the
+generic cell rate algorithm): Redis stores a single "theoretical arrival
+time" per client and scope, and allows or rejects the request atomically.
+Without ``THROTTLE_REDIS_URL`` the throttles fall back to DRF's cache
+based counting, which is fine for a single process.
+
+Views pick their limits by scope::
+
+    throttle_scope = "login"                   # every request of the view
+    throttle_scopes = {"create": "borrow_create"}  # per viewset action
+
+Requests without a scope are limited by the "user" or "anon" rate.
+"""
+
+import logging
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.throttling import SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+# Times are in microseconds. Allows ``period / interval`` requests in a
+# burst, then one per ``interval``; returns {allowed, microseconds to wait}.
+# Reading TIME before writing relies on effect replication, the default
+# since Redis 5.
+GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1])) or now, now)
+local allow_at = tat + interval - period
+if now < allow_at then
+    return {0, allow_at - now}
+end
+local expires = math.ceil((tat + interval - now) / 1000)
+redis.call('SET', KEYS[1], string.format('%.0f', tat + interval), 'PX', expires)
+return {1, 0}
+"""
+
+
+@lru_cache(maxsize=None)
+def get_redis():
+    if not settings.THROTTLE_REDIS_URL:
+        return None
+    return redis.Redis.from_url(
+        settings.THROTTLE_REDIS_URL, socket_connect_timeout=1, socket_timeout=1
+    )
+
+
+@lru_cache(maxsize=None)
+def get_gcra_script(client):
+    return client.register_script(GCRA_SCRIPT)
+
+
+@receiver(setting_changed)
+def reset_redis(*, setting, **kwargs):
+    if setting == "THROTTLE_REDIS_URL":
+        get_redis.cache_clear()
+        get_gcra_script.cache_clear()
+
+
+class RedisRateThrottle(SimpleRateThrottle):
+    """``SimpleRateThrottle`` checked with GCRA in a single Redis call."""
+
+    wait_seconds = None
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        client = get_redis()
+        if client is None:
+            return super().allow_request(request, view)
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        period = self.duration * 1_000_000
+        try:
+            allowed, wait = get_gcra_script(client)(
+                keys=[self.key], args=[period // self.num_requests, period]
+            )
+        except redis.RedisError:
+            # Failing open keeps the API up while Redis is not.
+            logger.warning("Throttle check failed, request allowed.", exc_info=True)
+            return True
+
+        self.wait_seconds = wait / 1_000_000
+        return bool(allowed)
+
+    def wait(self):
+        if self.wait_seconds is None:
+            return super().wait()
+        return self.wait_seconds
+
+
+class ActionScopedRedisThrottle(RedisRateThrottle):
+    """Limits each user, or anonymous client address, per scope.
+
+    The scope is the view's ``throttle_scopes`` entry for the current
+    action, else its ``throttle_scope``, else "user" or "anon".
+    """
+
+    def __init__(self):
+        # The rate depends on the view, so it is looked up per request.
+        pass
+
+    def get_scope(self, request, view):
+        scope = getattr(view, "throttle_scopes", {}).get(
+            getattr(view, "action", None), getattr(view, "throttle_scope", None)
+        )
+        if scope:
+            return scope
+        return "user" if request.user and request.user.is_authenticated else "anon"
+
+    def allow_request(self, request, view):
+        self.scope = self.get_scope(request, view)
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
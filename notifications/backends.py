@@ -0,0 +1,175 @@
+"""Notification delivery backends.
+
+Backends are configured by name and messages are routed to them by kind::
+
+    NOTIFICATION_BACKENDS = {
+        "telegram": {"BACKEND": "notifications.backends.TelegramBackend"},
+        "audit": {
+            "BACKEND": "notifications.backends.FileBackend",
+            "OPTIONS": {"path": "/var/log/library/notifications.jsonl"},
+        },
+    }
+    NOTIFICATION_ROUTES = {
+        "default": ["telegram"],
+        "payment_succeeded": ["telegram", "audit"],
+    }
+
+``deliver()`` hands a batch to every backend routed for its kind at once,
+on a thread pool shared by the worker process.
+"""
+
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .telegram_bot import send_telegram_message
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KIND = "default"
+
+
+class BaseBackend(ABC):
+    # Rate limited backends make flushes wait for the shared token bucket.
+    rate_limited = False
+
+    @abstractmethod
+    def send_messages(self, kind, messages):
+        """Deliver ``messages`` (strings); return how many went out."""
+
+
+class TelegramBackend(BaseBackend):
+    rate_limited = True
+
+    def send_messages(self, kind, messages):
+        return sum(send_telegram_message(message) for message in messages)
+
+
+class EmailBackend(BaseBackend):
+    def __init__(self, recipients=(), subject="Library notification"):
+        self.recipients = list(recipients)
+        self.subject = subject
+
+    def send_messages(self, kind, messages):
+        if not self.recipients:
+            return 0
+        return send_mass_mail(
+            (self.subject, message, None, self.recipients) for message in messages
+        )
+
+
+class WebhookBackend(BaseBackend):
+    """POSTs ``{"kind": ..., "messages": [...]}`` to ``url``."""
+
+    def __init__(self, url, timeout=(3.05, 10)):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def send_messages(self, kind, messages):
+        response = self.session.post(
+            self.url,
+            json={"kind": kind, "messages": list(messages)},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return len(messages)
+
+
+class LocMemBackend(BaseBackend):
+    """Keeps delivered messages in ``self.outbox`` as ``(kind, message)``."""
+
+    def __init__(self):
+        self.outbox = []
+        self.lock = threading.Lock()
+
+    def send_messages(self, kind, messages):
+        with self.lock:
+            self.outbox.extend((kind, message) for message in messages)
+        return len(messages)
+
+
+class FileBackend(BaseBackend):
+    """Appends one JSON object per message to ``path``.
+
+    The file can be fed back to ``manage.py replay_notifications --file``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def send_messages(self, kind, messages):
+        sent_at = timezone.now().isoformat()
+        lines = "".join(
+            json.dumps({"kind": kind, "message": message, "sent_at": sent_at}) + "\n"
+            for message in messages
+        )
+        with self.lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(lines)
+        return len(messages)
+
+
+@lru_cache(maxsize=None)
+def get_backend(name):
+    config = settings.NOTIFICATION_BACKENDS[name]
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.NOTIFICATION_FANOUT_WORKERS,
+        thread_name_prefix="notification-fanout",
+    )
+
+
+def get_route(kind):
+    routes = settings.NOTIFICATION_ROUTES
+    return routes.get(kind, routes[DEFAULT_KIND])
+
+
+def is_rate_limited(kind, backends=None):
+    return any(get_backend(name).rate_limited for name in backends or get_route(kind))
+
+
+def deliver(kind, messages, backends=None):
+    """Send ``messages`` to every backend for ``kind`` in parallel.
+
+    Returns ``({backend name: messages sent}, [failed backend names])``; a
+    failing backend is logged without affecting the others.
+    """
+    names = backends or get_route(kind)
+    futures = {
+        name: get_executor().submit(get_backend(name).send_messages, kind, messages)
+        for name in names
+    }
+
+    sent = {}
+    failed = []
+    for name, future in futures.items():
+        try:
+            sent[name] = future.result()
+        except Exception:
+            logger.exception("Notification backend %r failed.", name)
+            failed.append(name)
+    return sent, failed
+
+
+@receiver(setting_changed)
+def reset_backends(*, setting, **kwargs):
+    if setting == "NOTIFICATION_BACKENDS":
+        get_backend.cache_clear()
+    elif setting == "NOTIFICATION_FANOUT_WORKERS":
+        get_executor.cache_clear()
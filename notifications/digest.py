@@ -0,0 +1,213 @@
+"""Redis buffer and rate limiter for outgoing notifications.
+
+Messages are appended to one Redis list instead of each getting its own
+Celery task. A flush claims them in order, merges them into digests and
+sends each digest once the shared token bucket allows it, so every worker
+together stays under the chat's rate limit. Each operation is a single
+Lua script, i.e. one atomic round trip.
+
+Claimed messages move to a pending list of their own until the flush acks
+them, so a worker that dies mid-flush loses nothing: once the claim is
+older than ``NOTIFICATION_CLAIM_TIMEOUT`` the next flush puts its messages
+back at the head of the buffer.
+"""
+
+import json
+import uuid
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+PUSH_SCRIPT = """
+local length = redis.call('RPUSH', KEYS[1], ARGV[1])
+local schedule = 0
+if redis.call('SET', KEYS[2], '1', 'NX', 'EX', ARGV[2]) then
+    schedule = 1
+end
+return {length, schedule}
+"""
+
+# Moves up to ARGV[1] messages from the buffer to the claim list KEYS[3],
+# recorded in the claims sorted set KEYS[2] by the time it was made, in
+# microseconds so claims of the same second keep their order.
+CLAIM_SCRIPT = """
+local messages = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #messages > 0 then
+    redis.call('LTRIM', KEYS[1], #messages, -1)
+    for _, message in ipairs(messages) do
+        redis.call('RPUSH', KEYS[3], message)
+    end
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+    redis.call('ZADD', KEYS[2], string.format('%.0f', now), KEYS[3])
+end
+return messages
+"""
+
+# Drops the claim KEYS[3]; ARGV are messages to put back at the head of
+# the buffer, in order.
+ACK_SCRIPT = """
+for index = #ARGV, 1, -1 do
+    redis.call('LPUSH', KEYS[1], ARGV[index])
+end
+redis.call('DEL', KEYS[3])
+redis.call('ZREM', KEYS[2], KEYS[3])
+"""
+
+# Puts the messages of claims older than ARGV[1] seconds back at the head
+# of the buffer. The claim lists are only known from the sorted set, so
+# this needs every key on one Redis node.
+RECOVER_SCRIPT = """
+local time = redis.call('TIME')
+local cutoff = tonumber(time[1]) - tonumber(ARGV[1])
+cutoff = cutoff * 1000000 + tonumber(time[2])
+local claims = redis.call(
+    'ZRANGEBYSCORE', KEYS[2], '-inf', string.format('%.0f', cutoff)
+)
+local recovered = 0
+for position = #claims, 1, -1 do
+    local messages = redis.call('LRANGE', claims[position], 0, -1)
+    for index = #messages, 1, -1 do
+        redis.call('LPUSH', KEYS[1], messages[index])
+    end
+    recovered = recovered + #messages
+    redis.call('DEL', claims[position])
+    redis.call('ZREM', KEYS[2], claims[position])
+end
+return recovered
+"""
+
+# Refills ``rate`` tokens per second up to ``capacity``; takes one token and
+# returns 0, or returns how many seconds until one is available. Reading
+# TIME before writing relies on effect replication, the default since
+# Redis 5.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+def encode_entry(kind, message, backends=None, attempts=0):
+    entry = {"kind": kind, "message": message}
+    if backends:
+        entry["backends"] = list(backends)
+    if attempts:
+        entry["attempts"] = attempts
+    return json.dumps(entry)
+
+
+def decode_entry(entry):
+    """Return ``(kind, message, backends, attempts)``.
+
+    ``backends`` names the backends a failed send is retried on, or is None
+    for every backend routed for ``kind``; ``attempts`` counts the failed
+    sends so far. Bare strings are default notifications.
+    """
+    try:
+        data = json.loads(entry)
+        backends = data.get("backends")
+        return (
+            data["kind"],
+            data["message"],
+            tuple(backends) if backends else None,
+            data.get("attempts", 0),
+        )
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return "default", entry, None, 0
+
+
+@lru_cache(maxsize=None)
+def get_redis():
+    return redis.Redis.from_url(
+        settings.NOTIFICATION_REDIS_URL,
+        socket_connect_timeout=2,
+        socket_timeout=5,
+        decode_responses=True,
+    )
+
+
+class NotificationBuffer:
+    def __init__(self, client=None, prefix="notifications"):
+        self.client = client or get_redis()
+        self.prefix = prefix
+        self.buffer_key = f"{prefix}:buffer"
+        self.flush_key = f"{prefix}:flush-scheduled"
+        self.bucket_key = f"{prefix}:bucket"
+        self.claims_key = f"{prefix}:claims"
+        self.push_script = self.client.register_script(PUSH_SCRIPT)
+        self.claim_script = self.client.register_script(CLAIM_SCRIPT)
+        self.ack_script = self.client.register_script(ACK_SCRIPT)
+        self.recover_script = self.client.register_script(RECOVER_SCRIPT)
+        self.token_script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def push(self, message, window):
+        """Append ``message``; return ``(buffered, schedule_flush)``.
+
+        ``schedule_flush`` is true for the first message of a ``window``
+        second period, so only one delayed flush is queued per period.
+        """
+        length, schedule = self.push_script(
+            keys=[self.buffer_key, self.flush_key], args=[message, window]
+        )
+        return length, bool(schedule)
+
+    def claim(self, count):
+        """Claim up to ``count`` of the oldest messages.
+
+        Returns ``(claim, messages)``; the messages stay pending until
+        ``ack(claim)``.
+        """
+        claim = f"{self.prefix}:claim:{uuid.uuid4().hex}"
+        messages = self.claim_script(
+            keys=[self.buffer_key, self.claims_key, claim], args=[count]
+        )
+        return claim, messages
+
+    def ack(self, claim, requeue=()):
+        """Finish ``claim``, putting ``requeue`` back at the head of the buffer."""
+        self.ack_script(
+            keys=[self.buffer_key, self.claims_key, claim], args=list(requeue)
+        )
+
+    def recover(self, timeout):
+        """Requeue the messages of claims older than ``timeout`` seconds.
+
+        Returns how many messages went back to the buffer.
+        """
+        return self.recover_script(
+            keys=[self.buffer_key, self.claims_key], args=[timeout]
+        )
+
+    def __len__(self):
+        return self.client.llen(self.buffer_key)
+
+    def acquire(self, rate, capacity):
+        """Take a send token; return 0 or the seconds to wait for one."""
+        return float(self.token_script(keys=[self.bucket_key], args=[rate, capacity]))
+
+    def clear(self):
+        claims = self.client.zrange(self.claims_key, 0, -1)
+        self.client.delete(
+            self.buffer_key, self.flush_key, self.bucket_key, self.claims_key, *claims
+        )
+
+
+@lru_cache(maxsize=None)
+def get_notification_buffer():
+    return NotificationBuffer()
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0001_initial"),
+        ("service_borrowing", "0003_borrowing_active_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OverdueReminder",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sent_on", models.DateField()),
+                ("batch", models.UUIDField()),
+                (
+                    "borrowing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="overdue_reminders",
+                        to="service_borrowing.borrowing",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["batch"], name="overdue_reminder_batch_idx"),
+                    models.Index(
+                        fields=["sent_on"], name="overdue_reminder_sent_on_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("borrowing", "sent_on"), name="unique_overdue_reminder"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import models
+
+
+class OutboxMessage(models.Model):
+    """A side effect recorded in the transaction that caused it.
+
+    ``handler`` is the dotted path of a function or Celery task that the
+    outbox dispatcher calls with ``payload`` as keyword arguments once the
+    transaction has committed.
+    """
+
+    handler = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(dispatched_at__isnull=True),
+                name="outbox_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.handler} #{self.id}"
+
+
+class OverdueReminder(models.Model):
+    """Ledger of overdue reminders, one row per borrowing and day.
+
+    A reminder task claims its borrowings by inserting rows tagged with its
+    own ``batch`` before sending, so a rerun or an overlapping run skips
+    everything that is already claimed.
+    """
+
+    borrowing = models.ForeignKey(
+        "service_borrowing.Borrowing",
+        on_delete=models.CASCADE,
+        related_name="overdue_reminders",
+    )
+    sent_on = models.DateField()
+    batch = models.UUIDField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["borrowing", "sent_on"], name="unique_overdue_reminder"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["batch"], name="overdue_reminder_batch_idx"),
+            models.Index(fields=["sent_on"], name="overdue_reminder_sent_on_idx"),
+        ]
+
+    def __str__(self):
+        return f"Borrowing #{self.borrowing_id} reminded on {self.sent_on}"
@@ -1,8 +1,146 @@
-from celery import shared_task
+import datetime
+import logging
+import uuid
+from itertools import groupby
+
+from celery import group, shared_task
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from . import outbox
+from .backends import DEFAULT_KIND, deliver, is_rate_limited
+from .digest import decode_entry, encode_entry, get_notification_buffer
+from .models import OutboxMessage, OverdueReminder
 from .telegram_bot import send_telegram_message
 from django.utils import timezone
 from service_borrowing.models import Borrowing
 
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Failed sends of a digest before it is dropped.
+NOTIFICATION_MAX_ATTEMPTS = 5
+OVERDUE_CHUNK_SIZE = 2000
+REMINDER_USERS_PER_TASK = 500
+REMINDER_SUBJECT = "Overdue library books"
+# Seconds before the first retry of reminders that failed; doubles each time.
+REMINDER_RETRY_DELAY = 60
+
+
+def pack_messages(lines, header="", limit=TELEGRAM_MESSAGE_LIMIT, separator="\n"):
+    """Join ``lines`` into as few messages of at most ``limit`` chars as fit.
+
+    ``header`` starts the first message only; a single line longer than
+    the limit is cut to fit.
+    """
+    message = header
+    for line in lines:
+        line = line[:limit]
+        if message and len(message) + len(separator) + len(line) > limit:
+            yield message
+            message = line
+        else:
+            message = f"{message}{separator}{line}" if message else line
+    if message and message != header:
+        yield message
+
+
+def queue_notification(message, kind=DEFAULT_KIND):
+    """Buffer ``message`` to go out with the next digest of its ``kind``.
+
+    The first message of a digest window schedules the flush for the end of
+    the window; a full digest is flushed right away.
+    """
+    buffered, schedule_flush = get_notification_buffer().push(
+        encode_entry(kind, message), settings.NOTIFICATION_DIGEST_WINDOW
+    )
+    if schedule_flush:
+        flush_notifications.apply_async(countdown=settings.NOTIFICATION_DIGEST_WINDOW)
+    if buffered % settings.NOTIFICATION_DIGEST_MAX_MESSAGES == 0:
+        flush_notifications.delay()
+
+
+@shared_task
+def flush_notifications():
+    """Deliver buffered notifications as one digest stream per kind.
+
+    Digests routed to a rate limited backend wait for the shared token
+    bucket; the ones it has no room for yet go back to the head of the
+    buffer and a flush is scheduled for when a token frees up. Digests a
+    backend failed to send go back as well, to be retried on that backend
+    only after ``NOTIFICATION_RETRY_DELAY`` seconds, and are dropped after
+    ``NOTIFICATION_MAX_ATTEMPTS`` failures. Claims left behind by a flush
+    that died are requeued first.
+    """
+    buffer = get_notification_buffer()
+    buffer.recover(settings.NOTIFICATION_CLAIM_TIMEOUT)
+    sent = 0
+    while True:
+        claim, entries = buffer.claim(settings.NOTIFICATION_DIGEST_MAX_MESSAGES)
+        if not entries:
+            break
+
+        messages_by_route = {}
+        for kind, message, *route in map(decode_entry, entries):
+            messages_by_route.setdefault((kind, *route), []).append(message)
+        digests = [
+            (kind, backends, attempts, digest)
+            for (kind, backends, attempts), messages in messages_by_route.items()
+            for digest in pack_messages(messages, separator="\n\n")
+        ]
+
+        wait = 0
+        failures = 0
+        requeue = []
+        for kind, backends, attempts, digest in digests:
+            if is_rate_limited(kind, backends):
+                wait = wait or buffer.acquire(
+                    settings.NOTIFICATION_SEND_RATE, settings.NOTIFICATION_SEND_BURST
+                )
+                if wait:
+                    requeue.append(encode_entry(kind, digest, backends, attempts))
+                    continue
+            _, failed = deliver(kind, [digest], backends)
+            if not failed:
+                sent += 1
+                continue
+            failures += 1
+            if attempts + 1 < NOTIFICATION_MAX_ATTEMPTS:
+                requeue.append(encode_entry(kind, digest, failed, attempts + 1))
+            else:
+                logger.error(
+                    "Dropped a %r digest after %s failed attempts on %s:\n%s",
+                    kind,
+                    attempts + 1,
+                    ", ".join(failed),
+                    digest,
+                )
+        buffer.ack(claim, requeue)
+
+        if wait:
+            flush_notifications.apply_async(countdown=wait)
+            return f"Sent {sent} digests, rate limited for {wait:.1f}s."
+        if requeue:
+            flush_notifications.apply_async(countdown=settings.NOTIFICATION_RETRY_DELAY)
+            return f"Sent {sent} digests, {failures} failed."
+
+    return f"Sent {sent} digests."
+
+
+@shared_task
+def dispatch_outbox():
+    return f"Dispatched {outbox.dispatch()} outbox messages."
+
+
+@shared_task
+def purge_outbox():
+    """Delete dispatched outbox messages older than ``OUTBOX_RETENTION``."""
+    deleted, _ = OutboxMessage.objects.filter(
+        dispatched_at__lt=timezone.now() - settings.OUTBOX_RETENTION
+    ).delete()
+    return f"Deleted {deleted} outbox messages."
+
 
 @shared_task
 def send_notification_task(message):
@@ -12,23 +150,178 @@ def send_notification_task(message):
 
 @shared_task
 def check_overdue_borrowings():
+    """Report every overdue borrowing in Telegram-sized messages.
 
+    Runs as a single streamed query, so memory use and the number of
+    queries do not grow with the number of overdue rows.
+    """
     today = timezone.now().date()
-    overdue_list = Borrowing.objects.filter(
-        actual_return_date__isnull=True, expected_return_date__lt=today
+    rows = (
+        Borrowing.objects.filter(
+            actual_return_date__isnull=True, expected_return_date__lt=today
+        )
+        .order_by("id")
+        .values_list("id", "book__title", "user__email")
+        .iterator(chunk_size=OVERDUE_CHUNK_SIZE)
     )
 
-    if not overdue_list.exists():
+    overdue = 0
+
+    def report_lines():
+        nonlocal overdue
+        for borrowing_id, title, email in rows:
+            overdue += 1
+            yield f"• ID: {borrowing_id}, Book: {title}, User: {email}"
+
+    for message in pack_messages(report_lines(), "🔔 ATTENTION! Overdue borrow:\n"):
+        queue_notification(message, kind="overdue_report")
+
+    if not overdue:
         message = "🎉 There are no overdue borrow today.!"
-        send_telegram_message(message)
+        queue_notification(message, kind="overdue_report")
         return "No overdue borrowings."
 
-    message_lines = ["🔔 ATTENTION! Overdue borrow:\n"]
-    for borrowing in overdue_list:
-        message_lines.append(
-            f"• ID: {borrowing.id}, Book: {borrowing.book.title}, "
-            f"User: {borrowing.user.email}"
+    return f"Sent notifications for {overdue} overdue borrowings."
+
+
+def overdue_for_reminder(today):
+    """Active overdue borrowings of active users not yet reminded ``today``."""
+    return Borrowing.objects.filter(
+        ~Exists(
+            OverdueReminder.objects.filter(borrowing=OuterRef("pk"), sent_on=today)
+        ),
+        actual_return_date__isnull=True,
+        expected_return_date__lt=today,
+        user__is_active=True,
+    )
+
+
+def reminder_text(lines):
+    return "Please return the following overdue books:\n" + "\n".join(
+        f"• {title} (due {due_date:%Y-%m-%d})" for title, due_date in lines
+    )
+
+
+@shared_task
+def send_overdue_reminders():
+    """Fan out per-user overdue reminders as groups of chunked tasks.
+
+    A single query walks the active-borrowings index for the ids of users
+    with something overdue; every ``REMINDER_USERS_PER_TASK`` of them
+    become one ``send_overdue_reminder_chunk`` task.
+    """
+    today = timezone.localdate()
+    user_ids = (
+        overdue_for_reminder(today)
+        .order_by("user_id")
+        .values_list("user_id", flat=True)
+        .distinct()
+        .iterator(chunk_size=OVERDUE_CHUNK_SIZE)
+    )
+
+    chunks = []
+    chunk = []
+    for user_id in user_ids:
+        chunk.append(user_id)
+        if len(chunk) == REMINDER_USERS_PER_TASK:
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+
+    if chunks:
+        # Reminders nobody got to by the end of the day are not worth sending.
+        tomorrow = datetime.datetime.combine(
+            today + datetime.timedelta(days=1),
+            datetime.time.min,
+            tzinfo=timezone.get_current_timezone(),
+        )
+        group(
+            send_overdue_reminder_chunk.s(chunk, today.isoformat()) for chunk in chunks
+        ).apply_async(expires=tomorrow)
+
+    users = sum(map(len, chunks))
+    return f"Queued reminders for {users} users in {len(chunks)} tasks."
+
+
+@shared_task(bind=True, max_retries=3)
+def send_overdue_reminder_chunk(self, user_ids, day):
+    """Email each of ``user_ids`` one reminder listing their overdue books.
+
+    The borrowings are claimed in the ledger before anything is sent, so
+    a borrowing is reminded at most once per ``day``. The emails share one
+    connection but are sent one at a time; the claims of those that fail
+    are released and the task is retried for them, up to ``max_retries``
+    times and only while ``day`` is still today.
+    """
+    today = datetime.date.fromisoformat(day)
+    if today != timezone.localdate():
+        return f"Reminders for {day} are out of date."
+    batch = uuid.uuid4()
+
+    with transaction.atomic():
+        borrowing_ids = list(
+            overdue_for_reminder(today)
+            .filter(user_id__in=user_ids)
+            .values_list("id", flat=True)
+        )
+        OverdueReminder.objects.bulk_create(
+            (
+                OverdueReminder(borrowing_id=borrowing_id, sent_on=today, batch=batch)
+                for borrowing_id in borrowing_ids
+            ),
+            batch_size=OVERDUE_CHUNK_SIZE,
+            ignore_conflicts=True,
         )
 
-    send_telegram_message("\n".join(message_lines))
-    return f"Sent notifications for {len(message_lines) - 1} overdue borrowings."
+    claimed = (
+        Borrowing.objects.filter(overdue_reminders__batch=batch)
+        .order_by("user_id", "expected_return_date")
+        .values_list("id", "user__email", "book__title", "expected_return_date")
+    )
+
+    countdown = REMINDER_RETRY_DELAY * 2**self.request.retries
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        OverdueReminder.objects.filter(batch=batch).delete()
+        raise self.retry(exc=e, countdown=countdown)
+
+    sent = 0
+    unsent = []
+    error = None
+    try:
+        for email, rows in groupby(claimed, key=lambda row: row[1]):
+            rows = list(rows)
+            message = EmailMessage(
+                REMINDER_SUBJECT,
+                reminder_text((title, due_date) for _, _, title, due_date in rows),
+                to=[email],
+                connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as e:
+                logger.exception("Overdue reminder to %s failed.", email)
+                unsent.extend(borrowing_id for borrowing_id, *_ in rows)
+                error = e
+            else:
+                sent += 1
+    finally:
+        connection.close()
+
+    if unsent:
+        OverdueReminder.objects.filter(batch=batch, borrowing_id__in=unsent).delete()
+        raise self.retry(exc=error, countdown=countdown)
+
+    return f"Sent {sent} overdue reminders."
+
+
+@shared_task
+def purge_overdue_reminders():
+    """Delete ledger rows older than ``OVERDUE_REMINDER_RETENTION``."""
+    deleted, _ = OverdueReminder.objects.filter(
+        sent_on__lt=timezone.localdate() - settings.OVERDUE_REMINDER_RETENTION
+    ).delete()
+    return f"Deleted {deleted} overdue reminders."
@@ -1,19 +1,79 @@
+"""Telegram Bot API transport.
+
+Messages go out through one keep-alive ``requests`` session per process,
+so consecutive sends reuse the TLS connection. Every request has connect
+and read timeouts. Rate limiting (429) is retried after the ``retry_after``
+Telegram asks for; network errors and 5xx answers are retried with
+exponential backoff.
+"""
+
+import logging
+import time
+from functools import lru_cache
+
 import requests
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = "https://api.telegram.org/bot{token}/sendMessage"
+TELEGRAM_TIMEOUT = (3.05, 10)
+TELEGRAM_MAX_ATTEMPTS = 4
+TELEGRAM_BACKOFF = 1
+# Longer waits are not worth holding a worker for; the send is given up.
+TELEGRAM_MAX_RETRY_AFTER = 30
+
+
+@lru_cache(maxsize=None)
+def get_session():
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=10)
+    session.mount("https://", adapter)
+    return session
+
+
+def retry_delay(response, attempt):
+    """Seconds to wait before retrying, or ``None`` if it is not worth it."""
+    if response is None or response.status_code >= 500:
+        return TELEGRAM_BACKOFF * 2**attempt
+    if response.status_code == 429:
+        try:
+            retry_after = response.json()["parameters"]["retry_after"]
+        except (ValueError, KeyError, TypeError):
+            retry_after = TELEGRAM_BACKOFF * 2**attempt
+        if retry_after <= TELEGRAM_MAX_RETRY_AFTER:
+            return retry_after
+    return None
+
 
 def send_telegram_message(message_text: str):
+    """Send ``message_text`` to the configured chat; return whether it went."""
     token = settings.TELEGRAM_BOT_TOKEN
     chat_id = settings.TELEGRAM_CHAT_ID
 
     if not token or not chat_id:
-        print("Telegram TOKEN or CHAT_ID do not exist.")
-        return
+        logger.warning("Telegram TOKEN or CHAT_ID do not exist.")
+        return False
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
+    url = TELEGRAM_API_URL.format(token=token)
     params = {"chat_id": chat_id, "text": message_text}
 
-    try:
-        requests.post(url, data=params)
-    except Exception as e:
-        print(f"Error send to Telegram: {e}")
+    for attempt in range(TELEGRAM_MAX_ATTEMPTS):
+        response = None
+        try:
+            response = get_session().post(url, data=params, timeout=TELEGRAM_TIMEOUT)
+            if response.ok:
+                return True
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+        except requests.RequestException as e:
+            error = str(e)
+
+        delay = retry_delay(response, attempt)
+        if delay is None or attempt == TELEGRAM_MAX_ATTEMPTS - 1:
+            logger.error("Error send to Telegram: %s", error)
+            return False
+
+        logger.warning("Telegram send failed (%s), retrying in %ss.", error, delay)
+        time.sleep(delay)
+
+    return False
@@ -0,0 +1,115 @@
+import datetime
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from notifications.backends import BaseBackend, deliver, get_backend
+from notifications.models import OutboxMessage
+from notifications.outbox import notify
+
+
+class FailingBackend(BaseBackend):
+    def send_messages(self, kind, messages):
+        raise ConnectionError("sink is down")
+
+
+TEST_BACKENDS = {
+    "locmem": {"BACKEND": "notifications.backends.LocMemBackend"},
+    "email": {
+        "BACKEND": "notifications.backends.EmailBackend",
+        "OPTIONS": {"recipients": ["staff@library.test"]},
+    },
+    "broken": {"BACKEND": "notifications.tests.test_backends.FailingBackend"},
+}
+
+
+@override_settings(
+    NOTIFICATION_BACKENDS=TEST_BACKENDS,
+    NOTIFICATION_ROUTES={
+        "default": ["locmem"],
+        "payment_succeeded": ["locmem", "email", "broken"],
+    },
+)
+class NotificationBackendTests(TestCase):
+    def setUp(self):
+        get_backend.cache_clear()
+        self.locmem = get_backend("locmem")
+
+    def test_messages_are_routed_by_kind(self):
+        deliver("borrowing_created", ["📚 Create new borrowing!"])
+
+        self.assertEqual(
+            self.locmem.outbox, [("borrowing_created", "📚 Create new borrowing!")]
+        )
+        self.assertEqual(mail.outbox, [])
+
+    def test_fan_out_survives_a_failing_backend(self):
+        sent, failed = deliver("payment_succeeded", ["✅ Payment success!"])
+
+        self.assertEqual(sent, {"locmem": 1, "email": 1})
+        self.assertEqual(failed, ["broken"])
+        self.assertEqual(len(self.locmem.outbox), 1)
+        self.assertEqual(mail.outbox[0].body, "✅ Payment success!")
+        self.assertEqual(mail.outbox[0].to, ["staff@library.test"])
+
+    def test_incomplete_backend_fails_when_built(self):
+        class IncompleteBackend(BaseBackend):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteBackend()
+
+    def test_file_backend_output_can_be_replayed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "notifications.jsonl"
+            with self.settings(
+                NOTIFICATION_BACKENDS={
+                    **TEST_BACKENDS,
+                    "file": {
+                        "BACKEND": "notifications.backends.FileBackend",
+                        "OPTIONS": {"path": str(path)},
+                    },
+                }
+            ):
+                deliver("overdue_report", ["first", "second"], backends=["file"])
+                records = [json.loads(line) for line in path.read_text().splitlines()]
+
+                out = StringIO()
+                call_command("replay_notifications", file=str(path), stdout=out)
+                replayed = get_backend("locmem").outbox
+
+        self.assertEqual([record["message"] for record in records], ["first", "second"])
+        self.assertEqual(
+            replayed, [("overdue_report", "first"), ("overdue_report", "second")]
+        )
+        self.assertIn("Replayed 2 notifications", out.getvalue())
+
+    def test_replay_a_day_from_the_outbox(self):
+        day = timezone.localdate() - datetime.timedelta(days=1)
+        for number in range(5):
+            notify(f"message {number}", kind="borrowing_created")
+        notify("today", kind="borrowing_created")
+        OutboxMessage.objects.exclude(payload__message="today").update(
+            created_at=timezone.now() - datetime.timedelta(days=1)
+        )
+
+        out = StringIO()
+        call_command(
+            "replay_notifications",
+            date=day,
+            batch_size=2,
+            backends=["locmem"],
+            stdout=out,
+        )
+
+        self.assertEqual(
+            [message for _, message in self.locmem.outbox],
+            [f"message {number}" for number in range(5)],
+        )
+        self.assertIn("locmem: 5 delivered", out.getvalue())
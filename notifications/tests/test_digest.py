@@ -0,0 +1,204 @@
+from unittest.mock import patch
+
+import fakeredis
+from django.test import SimpleTestCase, override_settings
+
+from notifications.backends import get_backend
+from notifications.digest import NotificationBuffer, decode_entry, encode_entry
+from notifications.tasks import (
+    NOTIFICATION_MAX_ATTEMPTS,
+    flush_notifications,
+    queue_notification,
+)
+
+
+@override_settings(
+    NOTIFICATION_DIGEST_WINDOW=10,
+    NOTIFICATION_DIGEST_MAX_MESSAGES=3,
+    NOTIFICATION_SEND_RATE=1,
+    NOTIFICATION_SEND_BURST=10,
+    NOTIFICATION_CLAIM_TIMEOUT=60,
+)
+@patch("notifications.tasks.flush_notifications.delay")
+@patch("notifications.tasks.flush_notifications.apply_async")
+class NotificationDigestTests(SimpleTestCase):
+    def setUp(self):
+        self.buffer = NotificationBuffer(
+            fakeredis.FakeRedis(decode_responses=True), prefix="test-notifications"
+        )
+        patcher = patch(
+            "notifications.tasks.get_notification_buffer", return_value=self.buffer
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_delayed_flush_per_window(self, mock_apply_async, mock_delay):
+        queue_notification("first")
+        queue_notification("second")
+
+        mock_apply_async.assert_called_once_with(countdown=10)
+        mock_delay.assert_not_called()
+        self.assertEqual(len(self.buffer), 2)
+
+    def test_full_digest_is_flushed_right_away(self, mock_apply_async, mock_delay):
+        for number in range(3):
+            queue_notification(f"message {number}")
+
+        mock_delay.assert_called_once_with()
+
+    @patch("notifications.backends.send_telegram_message")
+    def test_flush_sends_merged_digests(self, mock_send, *_):
+        for number in range(5):
+            queue_notification(f"message {number}")
+
+        result = flush_notifications()
+
+        self.assertEqual(result, "Sent 2 digests.")
+        self.assertEqual(
+            [call.args[0] for call in mock_send.call_args_list],
+            [
+                "message 0\n\nmessage 1\n\nmessage 2",
+                "message 3\n\nmessage 4",
+            ],
+        )
+        self.assertEqual(len(self.buffer), 0)
+
+    @override_settings(NOTIFICATION_SEND_RATE=1 / 60, NOTIFICATION_SEND_BURST=1)
+    @patch("notifications.backends.send_telegram_message")
+    def test_rate_limited_digests_wait_in_order(self, mock_send, mock_apply_async, _):
+        messages = [letter * 3000 for letter in "abc"]
+        for message in messages:
+            queue_notification(message)
+        mock_apply_async.reset_mock()
+
+        flush_notifications()
+
+        mock_send.assert_called_once_with(messages[0])
+        self.assertEqual(
+            [decode_entry(entry) for entry in self.buffer.claim(10)[1]],
+            [("default", message, None, 0) for message in messages[1:]],
+        )
+        countdown = mock_apply_async.call_args.kwargs["countdown"]
+        self.assertGreater(countdown, 50)
+        self.assertLessEqual(countdown, 60)
+
+    @override_settings(
+        NOTIFICATION_SEND_RATE=1 / 60,
+        NOTIFICATION_SEND_BURST=1,
+        NOTIFICATION_ROUTES={"default": ["telegram"], "audit": ["locmem"]},
+    )
+    @patch("notifications.tasks.deliver", return_value=({}, []))
+    def test_only_rate_limited_routes_wait_for_tokens(self, mock_deliver, *_):
+        for number in range(3):
+            queue_notification("x" * 3000, kind="audit")
+
+        self.assertEqual(flush_notifications(), "Sent 3 digests.")
+        self.assertEqual(mock_deliver.call_count, 3)
+
+    @override_settings(
+        NOTIFICATION_SEND_RATE=1 / 60,
+        NOTIFICATION_SEND_BURST=1,
+        NOTIFICATION_ROUTES={"default": ["telegram"], "audit": ["locmem"]},
+    )
+    @patch("notifications.backends.send_telegram_message")
+    def test_rate_limit_only_holds_back_its_own_kind(self, mock_send, *_):
+        get_backend.cache_clear()
+        self.addCleanup(get_backend.cache_clear)
+        queue_notification("a" * 3000)
+        queue_notification("b" * 3000)
+        queue_notification("audited", kind="audit")
+
+        flush_notifications()
+
+        mock_send.assert_called_once_with("a" * 3000)
+        self.assertEqual(get_backend("locmem").outbox, [("audit", "audited")])
+        self.assertEqual(
+            [decode_entry(entry) for entry in self.buffer.claim(10)[1]],
+            [("default", "b" * 3000, None, 0)],
+        )
+
+    @override_settings(
+        NOTIFICATION_BACKENDS={
+            "locmem": {"BACKEND": "notifications.backends.LocMemBackend"},
+            "broken": {"BACKEND": "notifications.tests.test_backends.FailingBackend"},
+        },
+        NOTIFICATION_ROUTES={"default": ["locmem", "broken"]},
+        NOTIFICATION_RETRY_DELAY=30,
+    )
+    def test_failed_sends_are_retried_on_the_failing_backend(self, mock_apply_async, _):
+        queue_notification("first")
+        queue_notification("second")
+        mock_apply_async.reset_mock()
+
+        self.assertEqual(flush_notifications(), "Sent 0 digests, 1 failed.")
+
+        mock_apply_async.assert_called_once_with(countdown=30)
+        self.assertEqual(get_backend("locmem").outbox, [("default", "first\n\nsecond")])
+        self.assertEqual(
+            [decode_entry(entry) for entry in self.buffer.claim(10)[1]],
+            [("default", "first\n\nsecond", ("broken",), 1)],
+        )
+
+    @override_settings(
+        NOTIFICATION_BACKENDS={
+            "broken": {"BACKEND": "notifications.tests.test_backends.FailingBackend"},
+        },
+    )
+    def test_digest_is_dropped_after_the_last_attempt(self, mock_apply_async, _):
+        self.buffer.client.rpush(
+            self.buffer.buffer_key,
+            encode_entry(
+                "default", "lost", ["broken"], attempts=NOTIFICATION_MAX_ATTEMPTS - 1
+            ),
+        )
+
+        with self.assertLogs("notifications.tasks", "ERROR"):
+            self.assertEqual(flush_notifications(), "Sent 0 digests.")
+
+        mock_apply_async.assert_not_called()
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_token_bucket_allows_a_burst_then_waits(self, *_):
+        waits = [self.buffer.acquire(rate=1, capacity=2) for _ in range(3)]
+
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertGreater(waits[2], 0)
+        self.assertLessEqual(waits[2], 1)
+
+    def test_claimed_messages_stay_pending_until_acked(self, *_):
+        for message in ("first", "second", "third"):
+            self.buffer.client.rpush(self.buffer.buffer_key, message)
+
+        claim, messages = self.buffer.claim(2)
+        self.assertEqual(messages, ["first", "second"])
+        self.assertEqual(self.buffer.recover(timeout=60), 0)
+
+        self.buffer.ack(claim, requeue=["second"])
+
+        self.assertEqual(self.buffer.claim(10)[1], ["second", "third"])
+
+    def test_abandoned_claims_are_requeued_in_order(self, *_):
+        for number in range(5):
+            self.buffer.client.rpush(self.buffer.buffer_key, f"message {number}")
+        self.buffer.claim(2)
+        self.buffer.claim(2)
+
+        self.assertEqual(self.buffer.recover(timeout=-1), 4)
+        self.assertEqual(
+            self.buffer.claim(10)[1], [f"message {number}" for number in range(5)]
+        )
+
+    @patch("notifications.tasks.deliver", side_effect=[({}, []), SystemExit])
+    def test_flush_that_dies_loses_no_messages(self, mock_deliver, *_):
+        for number in range(5):
+            queue_notification(f"message {number}")
+
+        with self.assertRaises(SystemExit):
+            flush_notifications()
+        self.assertEqual(len(self.buffer), 0)
+
+        mock_deliver.side_effect = None
+        mock_deliver.return_value = ({}, [])
+        with override_settings(NOTIFICATION_CLAIM_TIMEOUT=-1):
+            self.assertEqual(flush_notifications(), "Sent 1 digests.")
+        mock_deliver.assert_called_with("default", ["message 3\n\nmessage 4"], None)
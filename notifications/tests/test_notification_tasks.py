@@ -0,0 +1,236 @@
+import datetime
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from notifications.models import OverdueReminder
+from notifications.tasks import (
+    TELEGRAM_MESSAGE_LIMIT,
+    check_overdue_borrowings,
+    pack_messages,
+    send_overdue_reminder_chunk,
+    send_overdue_reminders,
+)
+from service_book.models import Book
+from service_borrowing.models import Borrowing
+
+User = get_user_model()
+
+
+class PackMessagesTests(SimpleTestCase):
+    def test_lines_share_a_message_until_the_limit(self):
+        messages = list(pack_messages(["a" * 4, "b" * 4, "c" * 4], "head", limit=14))
+
+        self.assertEqual(messages, ["head\naaaa\nbbbb", "cccc"])
+
+    def test_overlong_line_is_cut_to_the_limit(self):
+        messages = list(pack_messages(["x" * 30], limit=10))
+
+        self.assertEqual(messages, ["x" * 10])
+
+    def test_no_lines_no_messages(self):
+        self.assertEqual(list(pack_messages([], "head")), [])
+
+
+@patch("notifications.tasks.queue_notification")
+class CheckOverdueBorrowingsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="user@test.com", password="testpassword123"
+        )
+        self.book = Book.objects.create(
+            title="T" * 120, author="Author", inventory=10, daily_fee=1
+        )
+        self.today = timezone.now().date()
+
+    def create_overdue(self, count, **params):
+        Borrowing.objects.bulk_create(
+            Borrowing(
+                user=self.user,
+                book=self.book,
+                expected_return_date=self.today + datetime.timedelta(days=1),
+                **params,
+            )
+            for _ in range(count)
+        )
+        Borrowing.objects.update(
+            borrow_date=self.today - datetime.timedelta(days=10),
+            expected_return_date=self.today - datetime.timedelta(days=1),
+        )
+
+    def test_reports_no_overdue_borrowings(self, mock_send):
+        self.create_overdue(1, actual_return_date=self.today)
+
+        result = check_overdue_borrowings()
+
+        self.assertEqual(result, "No overdue borrowings.")
+        mock_send.assert_called_once_with(
+            "🎉 There are no overdue borrow today.!", kind="overdue_report"
+        )
+
+    def test_report_is_split_into_telegram_sized_messages(self, mock_send):
+        self.create_overdue(300)
+
+        with self.assertNumQueries(1):
+            result = check_overdue_borrowings()
+
+        self.assertEqual(result, "Sent notifications for 300 overdue borrowings.")
+        messages = [call.args[0] for call in mock_send.call_args_list]
+        self.assertGreater(len(messages), 1)
+        self.assertTrue(all(len(m) <= TELEGRAM_MESSAGE_LIMIT for m in messages))
+        self.assertTrue(messages[0].startswith("🔔 ATTENTION! Overdue borrow:\n"))
+
+        reported_ids = [
+            int(line.split(",")[0].removeprefix("• ID: "))
+            for message in messages
+            for line in message.splitlines()
+            if line.startswith("• ID: ")
+        ]
+        self.assertEqual(
+            reported_ids,
+            list(Borrowing.objects.order_by("id").values_list("id", flat=True)),
+        )
+        self.assertIn(f"User: {self.user.email}", messages[-1])
+
+
+class OverdueReminderTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(
+            title="Dune", author="Author", inventory=10, daily_fee=1
+        )
+        self.today = timezone.localdate()
+        self.users = [
+            User.objects.create_user(email=f"user{i}@test.com", password="pass12345")
+            for i in range(5)
+        ]
+
+    def create_overdue(self, user, count=1):
+        Borrowing.objects.bulk_create(
+            Borrowing(
+                user=user,
+                book=self.book,
+                expected_return_date=self.today + datetime.timedelta(days=1),
+            )
+            for _ in range(count)
+        )
+        Borrowing.objects.filter(user=user).update(
+            borrow_date=self.today - datetime.timedelta(days=10),
+            expected_return_date=self.today - datetime.timedelta(days=1),
+        )
+
+    def user_ids(self):
+        return [user.id for user in self.users]
+
+    @patch("notifications.tasks.REMINDER_USERS_PER_TASK", 2)
+    @patch("notifications.tasks.group")
+    def test_fan_out_chunks_users_with_overdue_borrowings(self, mock_group):
+        for user in self.users:
+            self.create_overdue(user, count=2)
+        self.create_overdue(
+            User.objects.create_user(email="x@test.com", is_active=False)
+        )
+        Borrowing.objects.filter(user=self.users[4]).update(
+            actual_return_date=self.today
+        )
+
+        with self.assertNumQueries(1):
+            result = send_overdue_reminders()
+
+        self.assertEqual(result, "Queued reminders for 4 users in 2 tasks.")
+        signatures = list(mock_group.call_args.args[0])
+        self.assertEqual(
+            [signature.args for signature in signatures],
+            [
+                (self.user_ids()[:2], self.today.isoformat()),
+                (self.user_ids()[2:4], self.today.isoformat()),
+            ],
+        )
+        mock_group.return_value.apply_async.assert_called_once()
+
+    def test_chunk_sends_one_email_per_user(self):
+        self.create_overdue(self.users[0], count=3)
+        self.create_overdue(self.users[1])
+
+        result = send_overdue_reminder_chunk(self.user_ids(), self.today.isoformat())
+
+        self.assertEqual(result, "Sent 2 overdue reminders.")
+        self.assertEqual(
+            [message.to for message in mail.outbox],
+            [[self.users[0].email], [self.users[1].email]],
+        )
+        self.assertEqual(mail.outbox[0].body.count("• Dune"), 3)
+        self.assertEqual(OverdueReminder.objects.count(), 4)
+
+    def test_rerun_does_not_send_again(self):
+        self.create_overdue(self.users[0], count=2)
+        send_overdue_reminder_chunk(self.user_ids(), self.today.isoformat())
+
+        result = send_overdue_reminder_chunk(self.user_ids(), self.today.isoformat())
+
+        self.assertEqual(result, "Sent 0 overdue reminders.")
+        self.assertEqual(len(mail.outbox), 1)
+        with patch("notifications.tasks.group") as mock_group:
+            send_overdue_reminders()
+        mock_group.assert_not_called()
+
+    def test_failed_send_releases_the_claims(self):
+        self.create_overdue(self.users[0])
+
+        with patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=ConnectionError,
+        ):
+            with self.assertRaises(ConnectionError):
+                send_overdue_reminder_chunk(self.user_ids(), self.today.isoformat())
+
+        self.assertFalse(OverdueReminder.objects.exists())
+        send_overdue_reminder_chunk(self.user_ids(), self.today.isoformat())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_only_unsent_claims_are_released(self):
+        self.create_overdue(self.users[0], count=2)
+        self.create_overdue(self.users[1])
+
+        with patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=[1, ConnectionError],
+        ):
+            with self.assertRaises(ConnectionError):
+                send_overdue_reminder_chunk(self.user_ids(), self.today.isoformat())
+
+        self.assertEqual(
+            set(OverdueReminder.objects.values_list("borrowing__user", flat=True)),
+            {self.users[0].id},
+        )
+        send_overdue_reminder_chunk(self.user_ids(), self.today.isoformat())
+        self.assertEqual(
+            [message.to for message in mail.outbox], [[self.users[1].email]]
+        )
+
+    def test_failed_sends_are_retried_a_bounded_number_of_times(self):
+        self.create_overdue(self.users[0])
+
+        with patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=ConnectionError,
+        ) as mock_send:
+            result = send_overdue_reminder_chunk.apply(
+                (self.user_ids(), self.today.isoformat())
+            )
+
+        self.assertIsInstance(result.result, ConnectionError)
+        self.assertEqual(mock_send.call_count, 4)
+        self.assertFalse(OverdueReminder.objects.exists())
+
+    def test_reminders_for_a_past_day_are_dropped(self):
+        self.create_overdue(self.users[0])
+        yesterday = self.today - datetime.timedelta(days=1)
+
+        result = send_overdue_reminder_chunk(self.user_ids(), yesterday.isoformat())
+
+        self.assertEqual(result, f"Reminders for {yesterday} are out of date.")
+        self.assertEqual(mail.outbox, [])
+        self.assertFalse(OverdueReminder.objects.exists())
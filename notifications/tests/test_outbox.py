@@ -0,0 +1,107 @@
+import datetime
+from unittest.mock import patch
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from notifications import outbox
+from notifications.models import OutboxMessage
+from notifications.tasks import dispatch_outbox, purge_outbox
+from service_payments.tasks import create_checkout_session
+
+calls = []
+
+
+def record_call(**payload):
+    calls.append(payload)
+
+
+def fail(**payload):
+    raise RuntimeError("handler is down")
+
+
+RECORD_HANDLER = "notifications.tests.test_outbox.record_call"
+FAIL_HANDLER = "notifications.tests.test_outbox.fail"
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_rolled_back_messages_are_never_dispatched(self):
+        try:
+            with transaction.atomic():
+                outbox.notify("📚 Create new borrowing!")
+                raise RuntimeError("borrowing failed")
+        except RuntimeError:
+            pass
+
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_dispatch_runs_handlers_in_batches(self):
+        for number in range(5):
+            outbox.publish(RECORD_HANDLER, number=number)
+
+        self.assertEqual(outbox.dispatch(batch_size=2), 5)
+
+        self.assertEqual(calls, [{"number": number} for number in range(5)])
+        self.assertFalse(
+            OutboxMessage.objects.filter(dispatched_at__isnull=True).exists()
+        )
+        self.assertEqual(outbox.dispatch(), 0)
+
+    @patch.object(create_checkout_session, "delay")
+    def test_celery_task_handlers_are_queued(self, mock_delay):
+        outbox.publish(
+            "service_payments.tasks.create_checkout_session",
+            payment_id=7,
+            success_url="http://testserver/success",
+            cancel_url="http://testserver/cancel",
+        )
+
+        self.assertEqual(dispatch_outbox(), "Dispatched 1 outbox messages.")
+
+        mock_delay.assert_called_once_with(
+            payment_id=7,
+            success_url="http://testserver/success",
+            cancel_url="http://testserver/cancel",
+        )
+
+    def test_failed_messages_are_kept_for_a_later_run(self):
+        failing = outbox.publish(FAIL_HANDLER)
+        outbox.publish(RECORD_HANDLER, number=1)
+
+        self.assertEqual(outbox.dispatch(), 1)
+
+        failing.refresh_from_db()
+        self.assertIsNone(failing.dispatched_at)
+        self.assertEqual(failing.attempts, 1)
+        self.assertIn("handler is down", failing.last_error)
+        self.assertEqual(calls, [{"number": 1}])
+
+    def test_messages_out_of_attempts_are_skipped(self):
+        OutboxMessage.objects.create(
+            handler=RECORD_HANDLER, attempts=outbox.OUTBOX_MAX_ATTEMPTS
+        )
+
+        self.assertEqual(outbox.dispatch(), 0)
+        self.assertEqual(calls, [])
+
+    @override_settings(OUTBOX_RETENTION=datetime.timedelta(days=7))
+    def test_purge_deletes_old_dispatched_messages(self):
+        now = timezone.now()
+        old = outbox.publish(RECORD_HANDLER)
+        recent = outbox.publish(RECORD_HANDLER)
+        pending = outbox.publish(RECORD_HANDLER)
+        OutboxMessage.objects.filter(id=old.id).update(
+            dispatched_at=now - datetime.timedelta(days=8)
+        )
+        OutboxMessage.objects.filter(id=recent.id).update(dispatched_at=now)
+
+        self.assertEqual(purge_outbox(), "Deleted 1 outbox messages.")
+
+        self.assertEqual(
+            set(OutboxMessage.objects.values_list("id", flat=True)),
+            {recent.id, pending.id},
+        )
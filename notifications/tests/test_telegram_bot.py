@@ -0,0 +1,82 @@
+from unittest.mock import MagicMock, patch
+
+import requests
+from django.test import SimpleTestCase, override_settings
+
+from notifications.telegram_bot import (
+    TELEGRAM_MAX_ATTEMPTS,
+    TELEGRAM_TIMEOUT,
+    send_telegram_message,
+)
+
+
+def telegram_response(status_code, payload=None):
+    response = MagicMock(status_code=status_code, ok=status_code == 200, text="")
+    response.json.return_value = payload or {}
+    return response
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="123:abc", TELEGRAM_CHAT_ID="42")
+@patch("notifications.telegram_bot.time.sleep")
+@patch("notifications.telegram_bot.get_session")
+class SendTelegramMessageTests(SimpleTestCase):
+    def test_sends_through_shared_session_with_timeout(self, mock_session, _):
+        post = mock_session.return_value.post
+        post.return_value = telegram_response(200)
+
+        self.assertTrue(send_telegram_message("hello"))
+
+        post.assert_called_once_with(
+            "https://api.telegram.org/bot123:abc/sendMessage",
+            data={"chat_id": "42", "text": "hello"},
+            timeout=TELEGRAM_TIMEOUT,
+        )
+
+    def test_honors_retry_after_when_rate_limited(self, mock_session, mock_sleep):
+        post = mock_session.return_value.post
+        post.side_effect = [
+            telegram_response(429, {"parameters": {"retry_after": 7}}),
+            telegram_response(200),
+        ]
+
+        self.assertTrue(send_telegram_message("hello"))
+
+        mock_sleep.assert_called_once_with(7)
+        self.assertEqual(post.call_count, 2)
+
+    def test_backs_off_on_network_errors_then_gives_up(self, mock_session, mock_sleep):
+        post = mock_session.return_value.post
+        post.side_effect = requests.ConnectionError("connection reset")
+
+        self.assertFalse(send_telegram_message("hello"))
+
+        self.assertEqual(post.call_count, TELEGRAM_MAX_ATTEMPTS)
+        self.assertEqual(
+            [call.args[0] for call in mock_sleep.call_args_list], [1, 2, 4]
+        )
+
+    def test_client_errors_are_not_retried(self, mock_session, mock_sleep):
+        post = mock_session.return_value.post
+        post.return_value = telegram_response(400)
+
+        self.assertFalse(send_telegram_message("hello"))
+
+        post.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    def test_long_retry_after_is_not_waited_for(self, mock_session, mock_sleep):
+        post = mock_session.return_value.post
+        post.return_value = telegram_response(
+            429, {"parameters": {"retry_after": 3600}}
+        )
+
+        self.assertFalse(send_telegram_message("hello"))
+
+        post.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    @override_settings(TELEGRAM_BOT_TOKEN=None)
+    def test_missing_credentials_skip_the_request(self, mock_session, _):
+        self.assertFalse(send_telegram_message("hello"))
+
+        mock_session.assert_not_called()
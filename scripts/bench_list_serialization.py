@@ -0,0 +1,72 @@
+"""Benchmark list serialization: DRF serializers vs the fast read path.
+
+Runs against a throwaway test database:
+
+    SECRET_KEY=... python scripts/bench_list_serialization.py [rows]
+"""
+
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import django
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Library_Service.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from Library_Service.fast_read import get_read_plan  # noqa: E402
+from service_book.models import Book  # noqa: E402
+from service_book.serializers import BookSerializer  # noqa: E402
+
+REPEAT = 5
+
+
+def best_of(func):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(rows):
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        Book.objects.bulk_create(
+            Book(
+                title=f"Title {number}",
+                author=f"Author {number % 100}",
+                cover="SOFT" if number % 2 else "HARD",
+                inventory=number % 7,
+                daily_fee=Decimal(number % 1000) / 100,
+            )
+            for number in range(rows)
+        )
+        queryset = Book.objects.order_by("-id")
+        plan = get_read_plan(BookSerializer)
+
+        drf_time, drf_data = best_of(
+            lambda: BookSerializer(list(queryset), many=True).data
+        )
+        fast_time, fast_data = best_of(
+            lambda: plan.to_representation_many(queryset.values(*plan.sources))
+        )
+
+        assert json.dumps(drf_data) == json.dumps(fast_data)
+        print(f"rows:       {rows}")
+        print(f"serializer: {drf_time * 1000:.1f} ms")
+        print(f"fast read:  {fast_time * 1000:.1f} ms")
+        print(f"speedup:    {drf_time / fast_time:.1f}x")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ServiceConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "service_book"
+
+    def ready(self):
+        import service_book.signals  # noqa: F401
@@ -0,0 +1,79 @@
+"""Versioned response cache for the book catalog.
+
+Every committed catalog write bumps a version counter. Cache keys and ETags
+are derived from that version, so entries written before a change are never
+read again and simply expire. Answering a request only costs one cache read
+for the version, plus one for the body when the client has no fresh copy.
+"""
+
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = "book:catalog:version"
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seeding from the clock keeps a lost counter from ever going back
+        # to a version that still has cached responses.
+        version = time.time_ns()
+        if not cache.add(CATALOG_VERSION_KEY, version, timeout=None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def cached_catalog_response(request, render):
+    """Serve ``render()``'s response from the catalog cache.
+
+    Answers a matching ``If-None-Match`` with 304 and otherwise reuses the
+    cached response data; only successful responses are stored.
+    ``If-None-Match: *`` only matches a resource that exists, i.e. a
+    cached or freshly rendered 200.
+    """
+    version = get_catalog_version()
+    digest = hashlib.sha256(
+        "|".join(
+            (
+                str(version),
+                request.build_absolute_uri(),
+                request.accepted_media_type or "",
+            )
+        ).encode()
+    ).hexdigest()
+    etag = f'"{digest[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in if_none_match:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    any_etag = "*" in if_none_match
+
+    cache_key = f"book:catalog:{digest}"
+    data = cache.get(cache_key)
+    if data is not None:
+        if any_etag:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(data, headers=headers)
+
+    response = render()
+    if response.status_code == status.HTTP_200_OK:
+        cache.set(cache_key, response.data, CATALOG_CACHE_TIMEOUT)
+        if any_etag:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        for header, value in headers.items():
+            response[header] = value
+    return response
@@ -0,0 +1,160 @@
+"""Streaming bulk import of books from CSV or JSON Lines.
+
+Rows are read lazily, validated in chunks with ``BookSerializer`` and
+written with one ``bulk_create`` per chunk, each chunk in its own short
+transaction. Rows carrying an ``id`` of an existing book are upserted
+(``update_conflicts``); invalid rows are reported and skipped without
+aborting the rest of the import.
+"""
+
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from service_book.cache import bump_catalog_version
+from service_book.models import Book
+from service_book.serializers import BookSerializer
+
+IMPORT_FORMATS = ("csv", "jsonl")
+IMPORT_FIELDS = ("title", "author", "cover", "inventory", "daily_fee")
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+def read_rows(lines, fmt):
+    """Yield one dict per record from an iterable of text lines.
+
+    Lines that cannot be parsed are yielded as ``ValueError`` instances so
+    the importer can report them against their row number. Input that
+    cannot be decoded, or CSV the reader gives up on, ends the rows with
+    one last ``ValueError``.
+    """
+    try:
+        yield from parse_rows(lines, fmt)
+    except UnicodeDecodeError as e:
+        yield ValueError(f"Invalid {e.encoding.upper()}: {e.reason}.")
+    except csv.Error as e:
+        yield ValueError(f"Invalid CSV: {e}")
+
+
+def parse_rows(lines, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(lines)
+    elif fmt == "jsonl":
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield ValueError(f"Invalid JSON: {e}")
+                continue
+            if not isinstance(row, dict):
+                yield ValueError("Each line must be a JSON object.")
+                continue
+            yield row
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+class BookImporter:
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.validator = BookSerializer()
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def run(self, rows):
+        numbered_rows = enumerate(rows, start=1)
+        while chunk := list(islice(numbered_rows, self.chunk_size)):
+            self.import_chunk(chunk)
+        return self.report()
+
+    def report(self):
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+    def add_error(self, row_number, detail):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "errors": detail})
+
+    def validate(self, row_number, row):
+        if isinstance(row, Exception):
+            self.add_error(row_number, {"non_field_errors": [str(row)]})
+            return None, None
+
+        try:
+            book_id = row.get("id") or None
+            if book_id is not None:
+                book_id = int(book_id)
+        except (TypeError, ValueError):
+            self.add_error(row_number, {"id": ["A valid integer is required."]})
+            return None, None
+
+        try:
+            return book_id, self.validator.run_validation(row)
+        except ValidationError as e:
+            self.add_error(row_number, e.detail)
+            return None, None
+
+    def import_chunk(self, chunk):
+        new_books = []
+        books_by_id = {}
+
+        for row_number, row in chunk:
+            book_id, data = self.validate(row_number, row)
+            if data is None:
+                continue
+            if book_id is None:
+                new_books.append(Book(**data))
+            elif book_id in books_by_id:
+                self.add_error(
+                    row_number,
+                    {
+                        "id": [
+                            f"Book with id {book_id} was already imported "
+                            f"from row {books_by_id[book_id][0]}."
+                        ]
+                    },
+                )
+            else:
+                books_by_id[book_id] = (row_number, Book(id=book_id, **data))
+
+        existing_ids = set(
+            Book.objects.filter(id__in=books_by_id).values_list("id", flat=True)
+        )
+        updated_books = []
+        for book_id, (row_number, book) in books_by_id.items():
+            if book_id in existing_ids:
+                updated_books.append(book)
+            else:
+                self.add_error(
+                    row_number, {"id": [f"Book with id {book_id} does not exist."]}
+                )
+
+        with transaction.atomic():
+            if new_books:
+                Book.objects.bulk_create(new_books)
+            if updated_books:
+                Book.objects.bulk_create(
+                    updated_books,
+                    update_conflicts=True,
+                    unique_fields=["id"],
+                    update_fields=IMPORT_FIELDS,
+                )
+            if new_books or updated_books:
+                # Every committed chunk is visible, even if a later one fails.
+                transaction.on_commit(bump_catalog_version)
+
+        self.created += len(new_books)
+        self.updated += len(updated_books)
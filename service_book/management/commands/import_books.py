@@ -0,0 +1,47 @@
+import json
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from service_book.importers import (
+    DEFAULT_CHUNK_SIZE,
+    IMPORT_FORMATS,
+    BookImporter,
+    read_rows,
+)
+
+
+class Command(BaseCommand):
+    """Django command to bulk import books from a CSV or JSONL file."""
+
+    help = "Import books from a CSV or JSON Lines file ('-' reads stdin)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=IMPORT_FORMATS)
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        path = options["path"]
+        fmt = options["format"] or Path(path).suffix.lstrip(".").lower()
+        if fmt not in IMPORT_FORMATS:
+            raise CommandError("Cannot detect the file format, pass --format.")
+
+        importer = BookImporter(chunk_size=options["chunk_size"])
+        if path == "-":
+            report = importer.run(read_rows(sys.stdin, fmt))
+        else:
+            with open(path, newline="", encoding="utf-8") as lines:
+                report = importer.run(read_rows(lines, fmt))
+
+        for error in report["errors"]:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {report['created']}, updated {report['updated']}, "
+                f"failed {report['failed']} books."
+            )
+        )
@@ -1,6 +1,6 @@
 import time
-from psycopg2 import OperationalError as Psycopg2OpError
 
+from django.db import connections
 from django.db.utils import OperationalError
 from django.core.management.base import BaseCommand
 
@@ -14,9 +14,9 @@ class Command(BaseCommand):
         db_conn = False
         while not db_conn:
             try:
-                self.check(databases=["default"])
+                connections["default"].ensure_connection()
                 db_conn = True
-            except (Psycopg2OpError, OperationalError):
+            except OperationalError:
                 self.stdout.write("Database unavailable, waiting 1 second...")
                 time.sleep(1)
 
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:59
+
+import django.db.models.functions.text
+import service_book.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("service_book", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="book",
+            index=service_book.models.PrefixSearchIndex(
+                django.db.models.functions.text.Upper("title"),
+                name="book_title_upper_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=service_book.models.PrefixSearchIndex(
+                django.db.models.functions.text.Upper("author"),
+                name="book_author_upper_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["cover", "daily_fee", "inventory"],
+                name="book_cover_fee_inventory_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,14 @@
+from django.db import migrations
+
+from service_book.search import install_search_index, uninstall_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("service_book", "0002_book_catalog_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -1,4 +1,85 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Upper
+
+from service_book.cache import bump_catalog_version
+
+
+class PrefixSearchIndex(models.Index):
+    """Index on UPPER(field) serving case-insensitive prefix lookups.
+
+    PostgreSQL only uses an expression index for ``LIKE 'prefix%'`` when it
+    is built with a pattern operator class, so the class is added there and
+    left out on backends that do not know it.
+    """
+
+    def create_sql(self, model, schema_editor, using="", **kwargs):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+        from django.contrib.postgres.indexes import OpClass
+
+        index = self.clone()
+        index.expressions = tuple(
+            OpClass(expression, name="text_pattern_ops")
+            for expression in self.expressions
+        )
+        return super(PrefixSearchIndex, index).create_sql(
+            model, schema_editor, using=using, **kwargs
+        )
+
+
+class BookQuerySet(models.QuerySet):
+    def reserve(self, book_id):
+        """Take one copy of the book if any is left; return whether it worked.
+
+        A single conditional UPDATE, so concurrent borrowers can never drive
+        the inventory below zero or lose each other's decrements.
+        """
+        reserved = self.filter(pk=book_id, inventory__gt=0).update(
+            inventory=F("inventory") - 1
+        )
+        if reserved:
+            transaction.on_commit(bump_catalog_version)
+        return bool(reserved)
+
+    def release(self, book_id, count=1):
+        """Put ``count`` copies of the book back on the shelf."""
+        return bool(self.release_many({book_id: count}))
+
+    def release_many(self, copies_by_book):
+        """Put copies of several books back with a single UPDATE.
+
+        ``copies_by_book`` maps book ids to the number of copies returned.
+        Must run in a transaction.
+        """
+        if not copies_by_book:
+            return 0
+
+        if len(copies_by_book) > 1:
+            # The UPDATE locks rows in whatever order the database scans
+            # them; locking in pk order first keeps two transactions
+            # releasing overlapping books from deadlocking.
+            list(
+                self.select_for_update()
+                .filter(pk__in=copies_by_book)
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+
+        released = self.filter(pk__in=copies_by_book).update(
+            inventory=F("inventory")
+            + Case(
+                *[
+                    When(pk=book_id, then=Value(copies))
+                    for book_id, copies in copies_by_book.items()
+                ],
+                output_field=models.PositiveIntegerField(),
+            )
+        )
+        if released:
+            transaction.on_commit(bump_catalog_version)
+        return released
 
 
 class Book(models.Model):
@@ -16,5 +97,17 @@ class Book(models.Model):
     inventory = models.PositiveIntegerField()
     daily_fee = models.DecimalField(max_digits=8, decimal_places=2)
 
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            PrefixSearchIndex(Upper("title"), name="book_title_upper_idx"),
+            PrefixSearchIndex(Upper("author"), name="book_author_upper_idx"),
+            models.Index(
+                fields=["cover", "daily_fee", "inventory"],
+                name="book_cover_fee_inventory_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.title} (Author: {self.author})"
@@ -0,0 +1,177 @@
+"""Full-text search over book titles and authors.
+
+The index lives in the database so bulk writes stay in sync too: SQLite
+keeps an external-content FTS5 table updated through triggers, PostgreSQL a
+generated ``search_vector`` column covered by a GIN index. Both are created
+by ``install_search_index``; run it again from any migration that makes
+SQLite rebuild ``service_book_book``, since that drops the triggers.
+"""
+
+import re
+
+from django.db import NotSupportedError, connections
+
+from service_book.models import Book
+
+BOOK_TABLE = "service_book_book"
+FTS_TABLE = "service_book_book_fts"
+SEARCH_CONFIG = "english"
+
+SQLITE_INSTALL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, author,
+        content='{BOOK_TABLE}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {BOOK_TABLE}
+    BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author)
+        VALUES (new.id, new.title, new.author);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {BOOK_TABLE}
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author)
+        VALUES ('delete', old.id, old.title, old.author);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF title, author ON {BOOK_TABLE}
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author)
+        VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO {FTS_TABLE}(rowid, title, author)
+        VALUES (new.id, new.title, new.author);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRESQL_INSTALL = [
+    f"""
+    ALTER TABLE {BOOK_TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(author, '')), 'B')
+    ) STORED
+    """,
+    f"""
+    CREATE INDEX IF NOT EXISTS {BOOK_TABLE}_search_idx
+    ON {BOOK_TABLE} USING GIN (search_vector)
+    """,
+]
+
+POSTGRESQL_UNINSTALL = [
+    f"DROP INDEX IF EXISTS {BOOK_TABLE}_search_idx",
+    f"ALTER TABLE {BOOK_TABLE} DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(schema_editor, statements):
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def install_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_INSTALL)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRESQL_INSTALL)
+
+
+def uninstall_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_UNINSTALL)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRESQL_UNINSTALL)
+
+
+def search_terms(query):
+    """Split user input into plain word tokens safe to embed in a query."""
+    return re.findall(r"\w+", query)
+
+
+class BookSearchResults:
+    """Books matching every term (as a prefix), most relevant first.
+
+    Implements ``count()`` and slicing so it can be handed to a Django
+    paginator; each page runs one ranked id query plus one ``in_bulk``.
+    """
+
+    def __init__(self, query, using="default"):
+        self.terms = search_terms(query)
+        self.connection = connections[using]
+
+        vendor = self.connection.vendor
+        if vendor == "sqlite":
+            self.match = " ".join(f'"{term}"*' for term in self.terms)
+            self.where = f"{FTS_TABLE} MATCH %s"
+            self.from_table = FTS_TABLE
+            self.id_column = "rowid"
+            self.rank = f"bm25({FTS_TABLE}, 10.0, 5.0)"
+            self.rank_params = []
+        elif vendor == "postgresql":
+            self.match = " & ".join(f"{term}:*" for term in self.terms)
+            self.where = f"search_vector @@ to_tsquery('{SEARCH_CONFIG}', %s)"
+            self.from_table = BOOK_TABLE
+            self.id_column = "id"
+            self.rank = f"-ts_rank_cd(search_vector, to_tsquery('{SEARCH_CONFIG}', %s))"
+            self.rank_params = [self.match]
+        else:
+            raise NotSupportedError(f"Book search is not available on {vendor}.")
+
+        self._count = None
+
+    def count(self):
+        if not self.terms:
+            return 0
+        if self._count is None:
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT COUNT(*) FROM {self.from_table} WHERE {self.where}",
+                    [self.match],
+                )
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None:
+            raise TypeError("Search results only support plain slicing.")
+        if not self.terms:
+            return []
+
+        offset = item.start or 0
+        limit = -1 if item.stop is None else max(item.stop - offset, 0)
+        if self.connection.vendor == "postgresql" and limit == -1:
+            limit = None
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {self.id_column} FROM {self.from_table} "
+                f"WHERE {self.where} "
+                f"ORDER BY {self.rank}, {self.id_column} "
+                "LIMIT %s OFFSET %s",
+                [self.match, *self.rank_params, limit, offset],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+
+        books = Book.objects.using(self.connection.alias).in_bulk(ids)
+        return [books[book_id] for book_id in ids if book_id in books]
@@ -1,14 +1,23 @@
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 
+from service_book.cache import get_catalog_version
+from service_book.importers import BookImporter
 from service_book.models import Book
 from service_book.serializers import BookSerializer
 
 
 BOOKS_URL = reverse("service_book:book-list")
+SEARCH_URL = reverse("service_book:book-search")
+IMPORT_URL = reverse("service_book:book-bulk-import")
+EXPORT_URL = reverse("service_book:book-export")
 
 
 def detail_url(book_id):
@@ -29,6 +38,7 @@ def create_sample_book(**params):
 
 class BookApiTests(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = get_user_model().objects.create_user(
             email="user@test.com", password="testpasswod123"
         )
@@ -63,9 +73,9 @@ class BookApiTests(APITestCase):
         res = self.client.get(BOOKS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 2)
-        self.assertIn(self.serializer1.data, res.data)
-        self.assertIn(self.serializer2.data, res.data)
+        self.assertEqual(len(res.data["results"]), 2)
+        self.assertIn(self.serializer1.data, res.data["results"])
+        self.assertIn(self.serializer2.data, res.data["results"])
 
     def test_authenticated_user_can_retrieve_book(self):
         self.client.force_authenticate(user=self.user)
@@ -133,3 +143,305 @@ class BookApiTests(APITestCase):
         self.assertEqual(Book.objects.count(), 1)
         book_exists = Book.objects.filter(id=self.book1.id).exists()
         self.assertFalse(book_exists)
+
+    def test_filter_books_by_title_prefix(self):
+        self.client.force_authenticate(user=self.user)
+        res = self.client.get(BOOKS_URL, {"title": "dun"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(self.serializer1.data, res.data["results"])
+        self.assertNotIn(self.serializer2.data, res.data["results"])
+
+    def test_filter_books_by_author_prefix(self):
+        self.client.force_authenticate(user=self.user)
+        res = self.client.get(BOOKS_URL, {"author": "SALIN"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn(self.serializer1.data, res.data["results"])
+        self.assertIn(self.serializer2.data, res.data["results"])
+
+    def test_filter_books_by_cover(self):
+        self.client.force_authenticate(user=self.user)
+        res = self.client.get(BOOKS_URL, {"cover": "SOFT"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertIn(self.serializer2.data, res.data["results"])
+
+    def test_filter_books_by_inventory_and_daily_fee(self):
+        book3 = create_sample_book(title="Emma", inventory=0, daily_fee=0.50)
+        book4 = create_sample_book(title="Ulysses", inventory=3, daily_fee=9.99)
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(BOOKS_URL, {"inventory_min": 1, "daily_fee_max": "5"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["results"]), 2)
+        ids = [book["id"] for book in res.data["results"]]
+        self.assertNotIn(book3.id, ids)
+        self.assertNotIn(book4.id, ids)
+
+    def test_filter_books_invalid_values(self):
+        self.client.force_authenticate(user=self.user)
+
+        for params in (
+            {"inventory_min": "many"},
+            {"daily_fee_max": "cheap"},
+            {"cover": "LEATHER"},
+        ):
+            res = self.client.get(BOOKS_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_books_ranked_by_relevance(self):
+        by_title = create_sample_book(title="Herbert West", author="Lovecraft")
+        create_sample_book(title="Emma", author="Jane Austen")
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(SEARCH_URL, {"q": "herb"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["count"], 2)
+        ids = [book["id"] for book in res.data["results"]]
+        self.assertEqual(ids, [by_title.id, self.book1.id])
+
+    def test_search_books_matches_all_terms(self):
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(SEARCH_URL, {"q": "dune frank"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["results"], [self.serializer1.data])
+
+    def test_search_index_follows_updates_and_deletes(self):
+        self.client.force_authenticate(user=self.user)
+        self.book1.title = "Children of Dune"
+        self.book1.save()
+        self.book2.delete()
+
+        res_new = self.client.get(SEARCH_URL, {"q": "children"})
+        res_deleted = self.client.get(SEARCH_URL, {"q": "catcher"})
+
+        self.assertEqual(res_new.data["count"], 1)
+        self.assertEqual(res_new.data["results"][0]["id"], self.book1.id)
+        self.assertEqual(res_deleted.data["count"], 0)
+
+    def test_search_books_paginated(self):
+        for number in range(5):
+            create_sample_book(title=f"Foundation {number}", author="Asimov")
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(SEARCH_URL, {"q": "foundation", "page_size": 2})
+
+        self.assertEqual(res.data["count"], 5)
+        self.assertEqual(len(res.data["results"]), 2)
+        self.assertIsNotNone(res.data["next"])
+
+    def test_search_books_requires_query(self):
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(SEARCH_URL, {"q": "  "})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_books_cursor_pagination(self):
+        book3 = create_sample_book(title="Emma")
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(BOOKS_URL, {"page_size": 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", res.data)
+        ids = [book["id"] for book in res.data["results"]]
+        self.assertEqual(ids, [book3.id, self.book2.id])
+
+        res = self.client.get(res.data["next"])
+
+        ids = [book["id"] for book in res.data["results"]]
+        self.assertEqual(ids, [self.book1.id])
+        self.assertIsNone(res.data["next"])
+        self.assertIsNotNone(res.data["previous"])
+
+    def test_list_books_not_modified_with_matching_etag(self):
+        self.client.force_authenticate(user=self.user)
+        res = self.client.get(BOOKS_URL)
+        etag = res["ETag"]
+
+        with self.assertNumQueries(0):
+            res = self.client.get(BOOKS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res["ETag"], etag)
+
+    def test_retrieve_book_served_from_cache(self):
+        self.client.force_authenticate(user=self.user)
+        first = self.client.get(detail_url(self.book1.id))
+
+        with self.assertNumQueries(0):
+            second = self.client.get(detail_url(self.book1.id))
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_any_etag_only_matches_existing_books(self):
+        self.client.force_authenticate(user=self.user)
+
+        found = self.client.get(detail_url(self.book1.id), HTTP_IF_NONE_MATCH="*")
+        missing = self.client.get(detail_url(999999), HTTP_IF_NONE_MATCH="*")
+
+        self.assertEqual(found.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_book_change_invalidates_catalog_cache(self):
+        self.client.force_authenticate(user=self.user)
+        res = self.client.get(detail_url(self.book1.id))
+        etag = res["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book1.title = "Dune Messiah"
+            self.book1.save()
+
+        res = self.client.get(detail_url(self.book1.id), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+        self.assertEqual(res.data["title"], "Dune Messiah")
+
+    def test_admin_can_import_books_from_csv(self):
+        self.client.force_authenticate(user=self.admin_user)
+        body = (
+            "id,title,author,cover,inventory,daily_fee\n"
+            ",Emma,Jane Austen,SOFT,3,1.50\n"
+            f"{self.book1.id},Dune,Frank Herbert,HARD,42,2.00\n"
+            ",Broken,Nobody,LEATHER,1,1.00\n"
+            "999999,Ghost,Nobody,HARD,1,1.00\n"
+        )
+
+        res = self.client.post(IMPORT_URL, body, content_type="text/csv")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["created"], 1)
+        self.assertEqual(res.data["updated"], 1)
+        self.assertEqual(res.data["failed"], 2)
+        self.assertEqual([error["row"] for error in res.data["errors"]], [3, 4])
+        self.assertTrue(Book.objects.filter(title="Emma", inventory=3).exists())
+        self.book1.refresh_from_db()
+        self.assertEqual(self.book1.inventory, 42)
+        self.assertEqual(Book.objects.count(), 3)
+
+    def test_admin_can_import_books_from_jsonl(self):
+        self.client.force_authenticate(user=self.admin_user)
+        body = (
+            '{"title": "Emma", "author": "Jane Austen", "inventory": 3, '
+            '"daily_fee": "1.50"}\n'
+            "not json\n"
+            '{"title": "Persuasion", "author": "Jane Austen", "inventory": -1, '
+            '"daily_fee": "1.50"}\n'
+        )
+
+        res = self.client.post(IMPORT_URL, body, content_type="application/x-ndjson")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["created"], 1)
+        self.assertEqual(res.data["failed"], 2)
+        self.assertIn("inventory", res.data["errors"][1]["errors"])
+
+    def test_import_reports_undecodable_input(self):
+        self.client.force_authenticate(user=self.admin_user)
+        body = b"title,author,cover,inventory,daily_fee\nEmma,Jane Austen,SOFT,3,1.50\n"
+        body += b"\xff\xfe,x\n"
+
+        res = self.client.post(IMPORT_URL, body, content_type="text/csv")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["created"], 1)
+        self.assertEqual(res.data["failed"], 1)
+        self.assertEqual(res.data["errors"][0]["row"], 2)
+
+    def test_import_reports_malformed_csv(self):
+        self.client.force_authenticate(user=self.admin_user)
+        body = "title,author\n" + "x" * 200_000 + ",y\n"
+
+        res = self.client.post(IMPORT_URL, body, content_type="text/csv")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["failed"], 1)
+        self.assertIn("Invalid CSV", str(res.data["errors"][0]["errors"]))
+
+    def test_import_rejects_an_empty_body(self):
+        self.client.force_authenticate(user=self.admin_user)
+
+        res = self.client.post(IMPORT_URL, "", content_type="text/csv")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_reports_repeated_ids(self):
+        self.client.force_authenticate(user=self.admin_user)
+        body = (
+            "id,title,author,cover,inventory,daily_fee\n"
+            f"{self.book1.id},Dune,Frank Herbert,HARD,42,2.00\n"
+            f"{self.book1.id},Dune,Frank Herbert,HARD,7,2.00\n"
+        )
+
+        res = self.client.post(IMPORT_URL, body, content_type="text/csv")
+
+        self.assertEqual(res.data["updated"], 1)
+        self.assertEqual(res.data["failed"], 1)
+        self.assertEqual(res.data["errors"][0]["row"], 2)
+        self.book1.refresh_from_db()
+        self.assertEqual(self.book1.inventory, 42)
+
+    def test_failed_import_still_invalidates_committed_chunks(self):
+        importer = BookImporter(chunk_size=1)
+        rows = [
+            {"title": "Emma", "author": "Jane Austen", "inventory": 3},
+            {"title": "Persuasion", "author": "Jane Austen", "inventory": 3},
+        ]
+        rows = [dict(row, cover="SOFT", daily_fee="1.50") for row in rows]
+        version = get_catalog_version()
+
+        with patch.object(
+            Book.objects, "bulk_create", side_effect=[None, DatabaseError]
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(DatabaseError):
+                    importer.run(rows)
+
+        self.assertGreater(get_catalog_version(), version)
+
+    def test_import_books_rejects_unknown_content_type(self):
+        self.client.force_authenticate(user=self.admin_user)
+
+        res = self.client.post(IMPORT_URL, "{}", content_type="application/xml")
+
+        self.assertEqual(res.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_authenticated_user_cannot_import_books(self):
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.post(IMPORT_URL, "title\nEmma\n", content_type="text/csv")
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_admin_can_export_books(self):
+        self.client.force_authenticate(user=self.admin_user)
+
+        res = self.client.get(EXPORT_URL, {"file_format": "csv", "cover": "SOFT"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Content-Type"], "text/csv")
+        content = b"".join(res.streaming_content).decode()
+        self.assertEqual(
+            content.splitlines(),
+            [
+                "id,title,author,cover,inventory,daily_fee",
+                f"{self.book2.id},Catcher in the Rye,Salinger,SOFT,10,1.99",
+            ],
+        )
+
+    def test_authenticated_user_cannot_export_books(self):
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
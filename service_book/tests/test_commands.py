@@ -0,0 +1,25 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db.utils import OperationalError
+from django.test import SimpleTestCase
+
+
+@patch("django.db.backends.base.base.BaseDatabaseWrapper.ensure_connection")
+class WaitForDbTests(SimpleTestCase):
+    def test_returns_once_the_database_is_ready(self, mock_connect):
+        call_command("wait_for_db", stdout=StringIO())
+
+        mock_connect.assert_called_once()
+
+    @patch("time.sleep")
+    def test_retries_until_the_database_accepts_connections(
+        self, mock_sleep, mock_connect
+    ):
+        mock_connect.side_effect = [OperationalError] * 3 + [None]
+
+        call_command("wait_for_db", stdout=StringIO())
+
+        self.assertEqual(mock_connect.call_count, 4)
+        self.assertEqual(mock_sleep.call_count, 3)
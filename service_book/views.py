@@ -1,30 +1,90 @@
-from django.views.generic import ListView
+import codecs
+from decimal import Decimal, InvalidOperation
+from functools import partial
+from itertools import chain
+
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.exceptions import UnsupportedMediaType, ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 
+from Library_Service.exporting import ExportMixin
+from Library_Service.fast_read import FastReadListMixin
+from Library_Service.pagination import BookSearchPagination
+from service_book.cache import cached_catalog_response
+from service_book.importers import BookImporter, read_rows
 from service_book.models import Book
 from service_book.permissions import IsAdminOrIfAuthenticatedReadOnly
+from service_book.search import BookSearchResults
 from service_book.serializers import BookSerializer
 
 
-class BookViewSet(viewsets.ModelViewSet):
+IMPORT_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/jsonl": "jsonl",
+    "application/x-ndjson": "jsonl",
+}
+
+
+class BookViewSet(ExportMixin, FastReadListMixin, viewsets.ModelViewSet):
+    export_name = "books"
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = [IsAdminOrIfAuthenticatedReadOnly]
+    throttle_scopes = {"list": "catalog", "retrieve": "catalog", "search": "catalog"}
+
+    def get_queryset(self):
+        queryset = self.queryset
+        params = self.request.query_params
+
+        title = params.get("title")
+        author = params.get("author")
+        cover = params.get("cover")
+        inventory_min = params.get("inventory_min")
+        daily_fee_max = params.get("daily_fee_max")
+
+        if title:
+            queryset = queryset.filter(title__istartswith=title)
+
+        if author:
+            queryset = queryset.filter(author__istartswith=author)
+
+        if cover:
+            if cover not in Book.CoverChoices.values:
+                raise ValidationError({"cover": f"Unknown cover: {cover}"})
+            queryset = queryset.filter(cover=cover)
+
+        if inventory_min:
+            try:
+                queryset = queryset.filter(inventory__gte=int(inventory_min))
+            except ValueError:
+                raise ValidationError({"inventory_min": "Must be an integer."})
+
+        if daily_fee_max:
+            try:
+                daily_fee_max = Decimal(daily_fee_max)
+            except InvalidOperation:
+                daily_fee_max = None
+            if daily_fee_max is None or not daily_fee_max.is_finite():
+                raise ValidationError({"daily_fee_max": "Must be a decimal."})
+            queryset = queryset.filter(daily_fee__lte=daily_fee_max)
+
+        return queryset
 
     @extend_schema(
         parameters=[
             OpenApiParameter(
                 name="title",
                 type=OpenApiTypes.STR,
-                description="Filter by title (ex. ?title=dune)",
+                description="Filter by title prefix (ex. ?title=dune)",
             ),
             OpenApiParameter(
                 name="author",
                 type=OpenApiTypes.STR,
-                description="Filter by author (ex. ?author=herbert)",
+                description="Filter by author prefix (ex. ?author=frank)",
             ),
             OpenApiParameter(
                 name="cover",
@@ -45,4 +105,69 @@ class BookViewSet(viewsets.ModelViewSet):
         ]
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        return cached_catalog_response(
+            request, partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_catalog_response(
+            request, partial(super().retrieve, request, *args, **kwargs)
+        )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="q",
+                type=OpenApiTypes.STR,
+                required=True,
+                description="Full-text search by title and author (ex. ?q=dune)",
+            ),
+        ],
+        responses={200: BookSerializer(many=True)},
+    )
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="search",
+        pagination_class=BookSearchPagination,
+    )
+    def search(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            raise ValidationError({"q": "This query parameter is required."})
+
+        page = self.paginate_queryset(BookSearchResults(query))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        request={content_type: bytes for content_type in IMPORT_CONTENT_TYPES},
+        responses={200: OpenApiTypes.OBJECT},
+        description=(
+            "Import books from a UTF-8 CSV or JSON Lines body. Under WSGI the "
+            "body must be sent with a Content-Length header; chunked uploads "
+            "are only read when served over ASGI."
+        ),
+    )
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        permission_classes=[IsAdminUser],
+    )
+    def bulk_import(self, request):
+        content_type = request.content_type.split(";")[0].strip()
+        fmt = IMPORT_CONTENT_TYPES.get(content_type)
+        if fmt is None:
+            raise UnsupportedMediaType(content_type)
+
+        # DRF's request.stream is None whenever Content-Length is missing,
+        # so read the Django request, which also holds chunked ASGI bodies.
+        body = iter(request._request)
+        first_line = next(body, b"")
+        if not first_line:
+            raise ValidationError("Request body is empty.")
+
+        lines = codecs.iterdecode(chain([first_line], body), "utf-8")
+        report = BookImporter().run(read_rows(lines, fmt))
+        return Response(report)
@@ -25,6 +25,27 @@ class Borrowing(models.Model):
                 name="expected_return_date_must_be_after_borrow_date",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["user", "expected_return_date"],
+                condition=models.Q(actual_return_date__isnull=True),
+                name="borrowing_active_user_due_idx",
+            ),
+            models.Index(
+                fields=["expected_return_date"],
+                condition=models.Q(actual_return_date__isnull=True),
+                name="borrowing_active_due_idx",
+            ),
+        ]
+
+    def calculate_fine(self, return_date):
+        """Fine owed for returning the book on ``return_date``."""
+        overdue_days = (return_date - self.expected_return_date).days
+        if overdue_days <= 0:
+            return 0
+
+        fine_multiplier = getattr(settings, "FINE_MULTIPLIER", 2)
+        return overdue_days * self.book.daily_fee * fine_multiplier
 
     def __str__(self):
         return (
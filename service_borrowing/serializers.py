@@ -20,3 +20,11 @@ class BorrowingSerializer(serializers.ModelSerializer):
             "actual_return_date",
             "user",
         )
+
+
+class BulkReturnSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=500,
+    )
@@ -1,21 +1,43 @@
+import csv
 import datetime
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
 import django.db.utils
+import stripe
 from decimal import Decimal
-from unittest.mock import patch, MagicMock
+from unittest.mock import MagicMock, patch
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 
 from service_book.models import Book
 from service_borrowing.models import Borrowing
+from service_borrowing.serializers import BorrowingSerializer
 from service_payments.models import Payment
+from service_payments.gateways import (
+    CircuitBreaker,
+    GatewayError,
+    RetryableGatewayError,
+    get_gateway,
+)
+from service_payments.tasks import create_checkout_session
+from notifications.models import OutboxMessage
+from notifications.outbox import NOTIFY_HANDLER
 
 User = get_user_model()
 
 BORROWINGS_URL = reverse("service_borrowing:borrowing-list")
+RETURN_BULK_URL = reverse("service_borrowing:borrowing-return-bulk")
+EXPORT_URL = reverse("service_borrowing:borrowing-export")
 
 
 def detail_url(borrowing_id):
@@ -26,6 +48,10 @@ def return_url(borrowing_id):
     return reverse("service_borrowing:borrowing-return-borrowing", args=[borrowing_id])
 
 
+def checkout_url(borrowing_id):
+    return reverse("service_borrowing:borrowing-checkout", args=[borrowing_id])
+
+
 def create_sample_book(**params):
     defaults = {
         "title": "Sample Book",
@@ -84,27 +110,112 @@ class BorrowingApiTests(APITestCase):
         temp_borrowing_3.save(update_fields=["borrow_date"])
         self.borrowing_other_user = temp_borrowing_3
 
-    @patch("service_borrowing.views.stripe.checkout.Session.create")
-    def test_create_borrowing_success_crashes_serializer(self, mock_stripe_session):
-        mock_stripe_session.return_value = MagicMock(
-            url="http://mock-stripe-url.com", id="sess_12345"
+    def test_list_borrowings_matches_serializer_output(self):
+        self.client.force_authenticate(user=self.admin_user)
+        self.borrowing_active.actual_return_date = self.today
+        self.borrowing_active.save()
+
+        res = self.client.get(BORROWINGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        expected = BorrowingSerializer(
+            Borrowing.objects.order_by("-id"), many=True
+        ).data
+        self.assertEqual(res.json()["results"], expected)
+
+    def test_regular_user_sees_only_own_borrowings(self):
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(BORROWINGS_URL, {"user_id": self.admin_user.id})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = {borrowing["id"] for borrowing in res.data["results"]}
+        self.assertEqual(ids, {self.borrowing_active.id, self.borrowing_overdue.id})
+
+    def test_regular_user_cannot_retrieve_other_borrowing(self):
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(detail_url(self.borrowing_other_user.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_admin_filters_borrowings(self):
+        self.borrowing_overdue.actual_return_date = self.today
+        self.borrowing_overdue.save()
+        other_book = create_sample_book(title="Other")
+        Borrowing.objects.create(
+            user=self.user, book=other_book, expected_return_date=self.tomorrow
+        )
+        self.client.force_authenticate(user=self.admin_user)
+
+        res = self.client.get(
+            BORROWINGS_URL,
+            {"user_id": self.user.id, "book_id": self.book1.id, "is_active": "true"},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [borrowing["id"] for borrowing in res.data["results"]]
+        self.assertEqual(ids, [self.borrowing_active.id])
+
+        res = self.client.get(BORROWINGS_URL, {"is_active": "false"})
+
+        ids = [borrowing["id"] for borrowing in res.data["results"]]
+        self.assertEqual(ids, [self.borrowing_overdue.id])
+
+    def test_filter_borrowings_invalid_values(self):
+        self.client.force_authenticate(user=self.admin_user)
+
+        for params in ({"book_id": "first"}, {"is_active": "maybe"}):
+            res = self.client.get(BORROWINGS_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_admin_exports_filtered_borrowings_as_csv(self):
+        self.client.force_authenticate(user=self.admin_user)
+
+        res = self.client.get(
+            EXPORT_URL, {"file_format": "csv", "user_id": self.user.id}
         )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Content-Type"], "text/csv")
+        self.assertIn('filename="borrowings.csv"', res["Content-Disposition"])
+        rows = list(
+            csv.DictReader(b"".join(res.streaming_content).decode().splitlines())
+        )
+        self.assertEqual(
+            [int(row["id"]) for row in rows],
+            [self.borrowing_active.id, self.borrowing_overdue.id],
+        )
+        self.assertEqual(list(rows[0]), list(BorrowingSerializer.Meta.fields))
+
+    def test_regular_user_cannot_export_borrowings(self):
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_create_borrowing_defers_checkout_session(self):
         self.client.force_authenticate(user=self.user)
         payload = {
             "book": self.book1.id,
             "expected_return_date": self.today + datetime.timedelta(days=5),
         }
 
-        with self.assertRaises(AssertionError):
-            self.client.post(BORROWINGS_URL, payload)
+        res = self.client.post(BORROWINGS_URL, payload)
 
-        self.assertTrue(Borrowing.objects.filter(user=self.user).exists())
-        self.assertTrue(Payment.objects.filter(session_id="sess_12345").exists())
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        payment = Payment.objects.get(borrowing_id=res.data["id"])
+        self.assertEqual(payment.status, Payment.StatusChoices.INITIALIZING)
+        self.assertEqual(payment.money_to_pay, Decimal("50.00"))
+        self.assertEqual(payment.session_url, "")
+        checkout = OutboxMessage.objects.get(
+            handler="service_payments.tasks.create_checkout_session"
+        )
+        self.assertEqual(checkout.payload["payment_id"], payment.id)
+        self.assertTrue(OutboxMessage.objects.filter(handler=NOTIFY_HANDLER).exists())
 
-    @patch("service_borrowing.views.stripe.checkout.Session.create")
-    def test_create_borrowing_invalid_date_fails_with_integrity_error(
-        self, mock_stripe_session
-    ):
+    def test_create_borrowing_invalid_date_fails_with_integrity_error(self):
 
         self.client.force_authenticate(user=self.user)
         payload = {
@@ -115,6 +226,28 @@ class BorrowingApiTests(APITestCase):
         with self.assertRaises(django.db.utils.IntegrityError):
             self.client.post(BORROWINGS_URL, payload)
 
+    def test_checkout_accepted_while_session_is_initializing(self):
+        self.client.force_authenticate(user=self.user)
+        payment = Payment.objects.create(
+            borrowing=self.borrowing_active,
+            money_to_pay=10,
+            status=Payment.StatusChoices.INITIALIZING,
+        )
+
+        res = self.client.get(checkout_url(self.borrowing_active.id))
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data["id"], payment.id)
+
+        payment.status = Payment.StatusChoices.PENDING
+        payment.session_url = "https://checkout.stripe.test/pay/cs_1"
+        payment.save()
+
+        res = self.client.get(checkout_url(self.borrowing_active.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["session_url"], payment.session_url)
+
     def test_return_book_success_no_fine(self):
         self.client.force_authenticate(user=self.user)
 
@@ -165,3 +298,295 @@ class BorrowingApiTests(APITestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("already been returned", str(res.data))
+
+    def test_return_book_uses_constant_number_of_queries(self):
+        self.client.force_authenticate(user=self.user)
+
+        # get_object, savepoint, borrowing update, book update, fine, release
+        with self.assertNumQueries(6):
+            res = self.client.post(return_url(self.borrowing_overdue.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["actual_return_date"], str(self.today))
+
+    def test_return_book_twice_releases_copy_once(self):
+        self.client.force_authenticate(user=self.user)
+        initial_inventory = self.book1.inventory
+
+        first = self.client.post(return_url(self.borrowing_overdue.id))
+        second = self.client.post(return_url(self.borrowing_overdue.id))
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code, status.HTTP_400_BAD_REQUEST)
+        self.book1.refresh_from_db()
+        self.assertEqual(self.book1.inventory, initial_inventory + 1)
+        self.assertEqual(
+            Payment.objects.filter(borrowing=self.borrowing_overdue).count(), 1
+        )
+
+    def test_admin_returns_borrowings_in_bulk(self):
+        self.borrowing_other_user.actual_return_date = self.today
+        self.borrowing_other_user.save()
+        self.client.force_authenticate(user=self.admin_user)
+        initial_inventory = self.book1.inventory
+
+        # savepoint, select, borrowings update, books update, fines, release
+        with self.assertNumQueries(6):
+            res = self.client.post(
+                RETURN_BULK_URL,
+                {
+                    "ids": [
+                        self.borrowing_active.id,
+                        self.borrowing_overdue.id,
+                        self.borrowing_other_user.id,
+                        999999,
+                    ]
+                },
+                format="json",
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data["results"],
+            [
+                {"id": self.borrowing_active.id, "status": "returned", "fine": None},
+                {
+                    "id": self.borrowing_overdue.id,
+                    "status": "returned",
+                    "fine": "20.00",
+                },
+                {
+                    "id": self.borrowing_other_user.id,
+                    "status": "already_returned",
+                    "fine": None,
+                },
+                {"id": 999999, "status": "not_found", "fine": None},
+            ],
+        )
+        self.book1.refresh_from_db()
+        self.assertEqual(self.book1.inventory, initial_inventory + 2)
+        self.assertEqual(
+            Borrowing.objects.filter(
+                actual_return_date__isnull=True, book=self.book1
+            ).count(),
+            0,
+        )
+        fine = Payment.objects.get(type=Payment.TypeChoices.FINE)
+        self.assertEqual(fine.borrowing_id, self.borrowing_overdue.id)
+
+    def test_bulk_return_locks_rows_in_pk_order(self):
+        other_book = create_sample_book(inventory=5, daily_fee=10.00)
+        other_borrowing = Borrowing.objects.create(
+            user=self.user, book=other_book, expected_return_date=self.tomorrow
+        )
+        self.client.force_authenticate(user=self.admin_user)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(
+                RETURN_BULK_URL,
+                {"ids": [other_borrowing.id, self.borrowing_active.id]},
+                format="json",
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        selects = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith("SELECT")
+            and ("service_borrowing" in query["sql"] or "service_book" in query["sql"])
+        ]
+        self.assertEqual(len(selects), 2)
+        self.assertTrue(all("ORDER BY" in sql for sql in selects))
+        other_book.refresh_from_db()
+        self.assertEqual(other_book.inventory, 6)
+
+    def test_regular_user_cannot_return_in_bulk(self):
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.post(
+            RETURN_BULK_URL, {"ids": [self.borrowing_active.id]}, format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_create_borrowing_out_of_stock_fails(self):
+        self.client.force_authenticate(user=self.user)
+        payload = {
+            "book": self.book_zero_inv.id,
+            "expected_return_date": self.tomorrow,
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(BORROWINGS_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("out of stock", str(res.data))
+        self.assertFalse(Borrowing.objects.filter(book=self.book_zero_inv).exists())
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
+class CheckoutSessionTaskTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="user@test.com", password="testpassword123"
+        )
+        self.book = create_sample_book(inventory=4)
+        self.borrowing = Borrowing.objects.create(
+            user=self.user,
+            book=self.book,
+            expected_return_date=timezone.now().date() + datetime.timedelta(days=3),
+        )
+        self.payment = Payment.objects.create(
+            borrowing=self.borrowing,
+            money_to_pay=6,
+            status=Payment.StatusChoices.INITIALIZING,
+        )
+
+    @override_settings(
+        PAYMENT_GATEWAY={"BACKEND": "service_payments.gateways.FakeGateway"}
+    )
+    def test_task_creates_session_with_fake_gateway(self):
+        create_checkout_session(
+            self.payment.id, "http://testserver/success", "http://testserver/cancel"
+        )
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PENDING)
+        self.assertTrue(self.payment.session_id.startswith("cs_test_"))
+        self.assertIn(self.payment.session_id, self.payment.session_url)
+        self.assertAlmostEqual(
+            self.payment.expires_at,
+            timezone.now() + settings.STRIPE_CHECKOUT_SESSION_LIFETIME,
+            delta=datetime.timedelta(minutes=1),
+        )
+
+    @override_settings(
+        PAYMENT_GATEWAY={
+            "BACKEND": "service_payments.gateways.StripeGateway",
+            "OPTIONS": {"api_key": "sk_test_123"},
+        }
+    )
+    @patch("stripe.checkout._session_service.SessionService.create")
+    def test_task_sends_the_session_expiry_to_stripe(self, mock_create):
+        mock_create.return_value = MagicMock(
+            id="cs_123", url="https://checkout.stripe.com/cs_123"
+        )
+
+        create_checkout_session(
+            self.payment.id, "http://testserver/success", "http://testserver/cancel"
+        )
+
+        self.payment.refresh_from_db()
+        params = mock_create.call_args.kwargs["params"]
+        self.assertEqual(params["expires_at"], int(self.payment.expires_at.timestamp()))
+
+    @override_settings(
+        PAYMENT_GATEWAY={
+            "BACKEND": "service_payments.gateways.StripeGateway",
+            "OPTIONS": {"api_key": "sk_test_123"},
+        }
+    )
+    @patch("stripe.checkout._session_service.SessionService.create")
+    def test_task_failure_expires_payment_and_releases_book(self, mock_create):
+        mock_create.side_effect = stripe.InvalidRequestError("Bad amount", "amount")
+
+        with self.assertRaises(GatewayError):
+            create_checkout_session(
+                self.payment.id, "http://testserver/success", "http://testserver/cancel"
+            )
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.StatusChoices.EXPIRED)
+        self.borrowing.refresh_from_db()
+        self.assertIsNotNone(self.borrowing.actual_return_date)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 5)
+
+    @patch("service_payments.tasks.get_gateway")
+    def test_task_skips_payment_already_initialized(self, mock_get_gateway):
+        self.payment.status = Payment.StatusChoices.PENDING
+        self.payment.save()
+
+        create_checkout_session(
+            self.payment.id, "http://testserver/success", "http://testserver/cancel"
+        )
+
+        mock_get_gateway.assert_not_called()
+
+    @override_settings(
+        PAYMENT_GATEWAY={
+            "BACKEND": "service_payments.gateways.FakeGateway",
+            "OPTIONS": {"failure_rate": 1.0, "failure_threshold": 1},
+        }
+    )
+    def test_task_keeps_payment_queued_while_circuit_is_open(self):
+        for _ in range(2):
+            with self.assertRaises(RetryableGatewayError):
+                create_checkout_session(
+                    self.payment.id,
+                    "http://testserver/success",
+                    "http://testserver/cancel",
+                )
+
+        self.assertEqual(get_gateway().breaker.state, CircuitBreaker.OPEN)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.StatusChoices.INITIALIZING)
+
+
+class ConcurrentBorrowingTests(TransactionTestCase):
+    PARALLEL_REQUESTS = 200
+    WORKERS = 20
+    INVENTORY = 50
+
+    @classmethod
+    def setUpClass(cls):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            raise unittest.SkipTest(
+                "an in-memory SQLite database cannot be shared between threads"
+            )
+        super().setUpClass()
+
+    def setUp(self):
+        # Earlier tests may have used up the borrow_create rate of these ids.
+        cache.clear()
+        self.users = [
+            User.objects.create_user(email=f"user{number}@test.com")
+            for number in range(self.WORKERS)
+        ]
+        self.book = create_sample_book(inventory=self.INVENTORY)
+
+    def borrow(self, number):
+        client = APIClient()
+        client.force_authenticate(user=self.users[number % self.WORKERS])
+        try:
+            res = client.post(
+                BORROWINGS_URL,
+                {
+                    "book": self.book.id,
+                    "expected_return_date": timezone.now().date()
+                    + datetime.timedelta(days=3),
+                },
+            )
+            inventory = Book.objects.values_list("inventory", flat=True).get(
+                id=self.book.id
+            )
+            return res.status_code, inventory
+        finally:
+            connection.close()
+
+    def test_parallel_borrowings_never_oversell(self):
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as executor:
+            results = list(executor.map(self.borrow, range(self.PARALLEL_REQUESTS)))
+        codes = [code for code, _ in results]
+
+        self.assertGreaterEqual(min(inventory for _, inventory in results), 0)
+        self.book.refresh_from_db()
+        self.assertEqual(codes.count(status.HTTP_201_CREATED), self.INVENTORY)
+        self.assertEqual(
+            codes.count(status.HTTP_400_BAD_REQUEST),
+            self.PARALLEL_REQUESTS - self.INVENTORY,
+        )
+        self.assertEqual(self.book.inventory, 0)
+        self.assertEqual(
+            Borrowing.objects.filter(book=self.book).count(), self.INVENTORY
+        )
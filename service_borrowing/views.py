@@ -1,33 +1,69 @@
-import stripe
+from collections import Counter
+
 from django.urls import reverse
 from django.utils import timezone
 from django.db import transaction
-from django.conf import settings
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
 from rest_framework.exceptions import ValidationError
+from Library_Service.exporting import ExportMixin
+from Library_Service.fast_read import FastReadListMixin
 from .models import Borrowing
-from .serializers import BorrowingSerializer
+from .serializers import BorrowingSerializer, BulkReturnSerializer
+from service_book.models import Book
 from service_payments.models import Payment
-from notifications.tasks import send_notification_task
+from service_payments.serializers import PaymentSerializer
+from notifications.outbox import notify, publish
 
 
-class BorrowingViewSet(viewsets.ModelViewSet):
+class BorrowingViewSet(ExportMixin, FastReadListMixin, viewsets.ModelViewSet):
+    export_name = "borrowings"
     queryset = Borrowing.objects.all()
     serializer_class = BorrowingSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scopes = {"create": "borrow_create"}
+
+    def get_queryset(self):
+        user = self.request.user
+        params = self.request.query_params
+
+        queryset = self.queryset.select_related("book", "user")
+        if not user.is_staff:
+            queryset = queryset.filter(user=user)
+
+        user_id = params.get("user_id")
+        book_id = params.get("book_id")
+        is_active = params.get("is_active")
+
+        try:
+            if user_id and user.is_staff:
+                queryset = queryset.filter(user_id=int(user_id))
+            if book_id:
+                queryset = queryset.filter(book_id=int(book_id))
+        except ValueError:
+            raise ValidationError("user_id and book_id must be integers.")
+
+        if is_active:
+            if is_active.lower() in ("true", "1"):
+                queryset = queryset.filter(actual_return_date__isnull=True)
+            elif is_active.lower() in ("false", "0"):
+                queryset = queryset.filter(actual_return_date__isnull=False)
+            else:
+                raise ValidationError({"is_active": "Must be true or false."})
+
+        return queryset
 
     @extend_schema(
         parameters=[
             OpenApiParameter(
                 name="user_id",
                 type=OpenApiTypes.INT,
-                description="Filter by user id (ex. ?user_id=1)",
+                description="Filter by user id, staff only (ex. ?user_id=1)",
             ),
             OpenApiParameter(
                 name="book_id",
@@ -38,7 +74,8 @@ class BorrowingViewSet(viewsets.ModelViewSet):
                 name="is_active",
                 type=OpenApiTypes.BOOL,
                 description=(
-                    "Filter by active (book is bot active). " "ex. ?is_active=true"
+                    "Filter by active (book is not returned yet). "
+                    "ex. ?is_active=true"
                 ),
             ),
         ],
@@ -51,37 +88,24 @@ class BorrowingViewSet(viewsets.ModelViewSet):
     def return_borrowing(self, request, pk=None):
 
         borrowing = self.get_object()
-
-        if borrowing.actual_return_date is not None:
-            return Response(
-                {"error": "This borrowing has already been returned."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        return_date = timezone.now().date()
 
         try:
             with transaction.atomic():
-                borrowing.actual_return_date = timezone.now().date()
-                borrowing.save()
-
-                book = borrowing.book
-                book.inventory += 1
-                book.save()
-
-                if borrowing.actual_return_date > borrowing.expected_return_date:
+                returned = Borrowing.objects.filter(
+                    pk=borrowing.pk, actual_return_date__isnull=True
+                ).update(actual_return_date=return_date)
 
-                    overdue_days = (
-                        borrowing.actual_return_date - borrowing.expected_return_date
-                    ).days
-
-                    try:
-                        fine_multiplier = settings.FINE_MULTIPLIER
-                    except AttributeError:
-                        fine_multiplier = 2
-
-                    money_to_pay = (
-                        overdue_days * borrowing.book.daily_fee * fine_multiplier
+                if not returned:
+                    return Response(
+                        {"error": "This borrowing has already been returned."},
+                        status=status.HTTP_400_BAD_REQUEST,
                     )
 
+                Book.objects.release(borrowing.book_id)
+
+                money_to_pay = borrowing.calculate_fine(return_date)
+                if money_to_pay > 0:
                     Payment.objects.create(
                         borrowing=borrowing,
                         status=Payment.StatusChoices.PENDING,
@@ -95,25 +119,102 @@ class BorrowingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+        borrowing.actual_return_date = return_date
         serializer = self.get_serializer(borrowing)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-    def perform_create(self, serializer):
+    @extend_schema(request=BulkReturnSerializer, responses={200: OpenApiTypes.OBJECT})
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="return-bulk",
+        permission_classes=[IsAdminUser],
+    )
+    def return_bulk(self, request):
+        """Check in a cart of borrowings in one transaction."""
+        serializer = BulkReturnSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data["ids"]))
+        return_date = timezone.now().date()
 
-        stripe.api_key = settings.STRIPE_SECRET_KEY
+        with transaction.atomic():
+            # Locked in pk order, so overlapping carts cannot deadlock.
+            borrowings = {
+                borrowing.id: borrowing
+                for borrowing in Borrowing.objects.select_for_update(of=("self",))
+                .select_related("book")
+                .filter(pk__in=ids)
+                .order_by("pk")
+            }
+            returned = [
+                borrowing
+                for borrowing in borrowings.values()
+                if borrowing.actual_return_date is None
+            ]
 
-        borrowing = serializer.save(user=self.request.user)
+            Borrowing.objects.filter(id__in=[b.id for b in returned]).update(
+                actual_return_date=return_date
+            )
+            Book.objects.release_many(Counter(b.book_id for b in returned))
 
-        try:
-            days_to_rent = (borrowing.expected_return_date - borrowing.borrow_date).days
-            money_to_pay = borrowing.book.daily_fee * days_to_rent
+            fines = {}
+            for borrowing in returned:
+                money_to_pay = borrowing.calculate_fine(return_date)
+                if money_to_pay > 0:
+                    fines[borrowing.id] = Payment(
+                        borrowing=borrowing,
+                        status=Payment.StatusChoices.PENDING,
+                        type=Payment.TypeChoices.FINE,
+                        money_to_pay=money_to_pay,
+                    )
+            Payment.objects.bulk_create(fines.values())
 
-            if money_to_pay <= 0:
-                raise ValidationError("Incorrect price")
+        results = []
+        for borrowing_id in ids:
+            borrowing = borrowings.get(borrowing_id)
+            if borrowing is None:
+                result_status = "not_found"
+            elif borrowing.actual_return_date is not None:
+                result_status = "already_returned"
+            else:
+                result_status = "returned"
 
-        except Exception as e:
-            borrowing.delete()
-            raise ValidationError(f"Error calculating price: {e}")
+            fine = fines.get(borrowing_id)
+            results.append(
+                {
+                    "id": borrowing_id,
+                    "status": result_status,
+                    "fine": f"{fine.money_to_pay:.2f}" if fine else None,
+                }
+            )
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    @extend_schema(responses={200: PaymentSerializer, 202: PaymentSerializer})
+    @action(detail=True, methods=["get"], url_path="checkout")
+    def checkout(self, request, pk=None):
+        """Poll the rent payment: 202 until its Stripe session is ready."""
+        borrowing = self.get_object()
+        payment = (
+            borrowing.payments.filter(type=Payment.TypeChoices.PAYMENT)
+            .order_by("-id")
+            .first()
+        )
+        if payment is None:
+            return Response(
+                {"error": "This borrowing has no payment."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        if payment.status == Payment.StatusChoices.INITIALIZING:
+            response_status = status.HTTP_202_ACCEPTED
+        else:
+            response_status = status.HTTP_200_OK
+        return Response(PaymentSerializer(payment).data, status=response_status)
+
+    def perform_create(self, serializer):
+
+        book = serializer.validated_data["book"]
 
         success_url = (
             self.request.build_absolute_uri(reverse("payment:payment-success"))
@@ -122,36 +223,36 @@ class BorrowingViewSet(viewsets.ModelViewSet):
 
         cancel_url = self.request.build_absolute_uri(reverse("payment:payment-cancel"))
 
-        try:
-            session = stripe.checkout.Session.create(
-                line_items=[
-                    {
-                        "price_data": {
-                            "currency": "usd",
-                            "product_data": {
-                                "name": f"Rent book: {borrowing.book.title}",
-                            },
-                            "unit_amount": int(money_to_pay * 100),
-                        },
-                        "quantity": 1,
-                    }
-                ],
-                mode="payment",
-                success_url=success_url,
-                cancel_url=cancel_url,
-            )
+        with transaction.atomic():
+            if not Book.objects.reserve(book.id):
+                raise ValidationError({"book": "This book is out of stock."})
+
+            borrowing = serializer.save(user=self.request.user)
+
+            try:
+                days_to_rent = (
+                    borrowing.expected_return_date - borrowing.borrow_date
+                ).days
+                money_to_pay = borrowing.book.daily_fee * days_to_rent
+
+                if money_to_pay <= 0:
+                    raise ValidationError("Incorrect price")
+
+            except Exception as e:
+                raise ValidationError(f"Error calculating price: {e}")
 
-            Payment.objects.create(
+            payment = Payment.objects.create(
                 borrowing=borrowing,
-                session_url=session.url,
-                session_id=session.id,
                 money_to_pay=money_to_pay,
-                status=Payment.StatusChoices.PENDING,
+                status=Payment.StatusChoices.INITIALIZING,
                 type=Payment.TypeChoices.PAYMENT,
             )
-            message = f"📚 Create new borrowing!\nBook: {borrowing.book.title}\nUser: {borrowing.user.email}"
-            send_notification_task.delay(message)
 
-        except Exception as e:
-            borrowing.delete()
-            raise ValidationError(f"Stripe error: {str(e)}")
+            publish(
+                "service_payments.tasks.create_checkout_session",
+                payment_id=payment.id,
+                success_url=success_url,
+                cancel_url=cancel_url,
+            )
+            message = f"📚 Create new borrowing!\nBook: {borrowing.book.title}\nUser: {borrowing.user.email}"
+            notify(message, kind="borrowing_created")
@@ -0,0 +1,396 @@
+"""Payment gateways behind one small interface.
+
+Views and tasks only talk to the gateway returned by ``get_gateway()``,
+configured like Django's own pluggable backends::
+
+    PAYMENT_GATEWAY = {
+        "BACKEND": "service_payments.gateways.StripeGateway",
+        "OPTIONS": {},
+    }
+
+``FakeGateway`` never leaves the process, so the borrowing and payment flow
+can be run, tested and load-tested without network access. Its ``latency``
+and ``failure_rate`` options imitate a slow or flaky provider.
+
+Every remote call goes through a per-process circuit breaker: after
+``failure_threshold`` consecutive transient failures calls fail fast with
+``CircuitOpenError`` for ``reset_timeout`` seconds, then one trial call
+decides whether the circuit closes again. Call latencies and the breaker
+state are reported by ``PaymentGateway.status()``.
+"""
+
+import json
+import logging
+from abc import ABC, abstractmethod
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CheckoutSession:
+    id: str
+    url: str
+    payment_status: str
+
+
+class GatewayError(Exception):
+    """The gateway rejected a request."""
+
+
+class RetryableGatewayError(GatewayError):
+    """A transient failure; the same request may succeed later."""
+
+
+class CircuitOpenError(RetryableGatewayError):
+    """The circuit breaker is open; the call was not attempted."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Payment gateway unavailable, retry in {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class InvalidWebhookError(GatewayError):
+    """A webhook payload was malformed or its signature did not match."""
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """Raise ``CircuitOpenError`` unless a call may go through now."""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                # Let exactly one trial call through.
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError(retry_after=max(int(remaining) + 1, 1))
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                logger.info("Payment gateway circuit closed.")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(
+                        "Payment gateway circuit opened after %d failures.",
+                        self.failures,
+                    )
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class CallMetrics:
+    """Latencies of the most recent gateway calls, per operation."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def record(self, operation, seconds, outcome):
+        with self.lock:
+            stats = self.calls.setdefault(
+                operation,
+                {"count": 0, "errors": 0, "latencies": deque(maxlen=self.window)},
+            )
+            stats["count"] += 1
+            if outcome != "ok":
+                stats["errors"] += 1
+            stats["latencies"].append(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            result = {}
+            for operation, stats in self.calls.items():
+                latencies = sorted(stats["latencies"])
+                result[operation] = {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "latency_ms": {
+                        "p50": round(latencies[len(latencies) // 2] * 1000, 1),
+                        "p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 1),
+                        "max": round(latencies[-1] * 1000, 1),
+                    },
+                }
+            return result
+
+
+class PaymentGateway(ABC):
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.metrics = CallMetrics()
+
+    @contextmanager
+    def guarded(self, operation):
+        """Run a remote call through the circuit breaker and record it."""
+        self.breaker.before_call()
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except RetryableGatewayError:
+            outcome = "unavailable"
+            self.breaker.record_failure()
+            raise
+        except GatewayError:
+            # The gateway answered; a rejected request says nothing about
+            # its health.
+            outcome = "rejected"
+            self.breaker.record_success()
+            raise
+        except BaseException:
+            # A timeout, an unmapped client error or a bug: the outcome is
+            # unknown, so count it against the gateway. Otherwise a trial
+            # call would leave the breaker half open for good.
+            outcome = "error"
+            self.breaker.record_failure()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            self.metrics.record(operation, time.perf_counter() - started, outcome)
+
+    def status(self):
+        return {
+            "backend": f"{type(self).__module__}.{type(self).__qualname__}",
+            "circuit": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+            },
+            "calls": self.metrics.snapshot(),
+        }
+
+    @abstractmethod
+    def create_checkout_session(
+        self,
+        *,
+        product_name,
+        amount,
+        success_url,
+        cancel_url,
+        expires_at=None,
+        currency="usd",
+    ):
+        """Open a checkout session charging ``amount`` (a ``Decimal``).
+
+        ``expires_at`` (an aware datetime) is when the session stops taking
+        payments; by default the provider's own lifetime applies.
+        """
+
+    @abstractmethod
+    def retrieve_checkout_session(self, session_id):
+        """Return the current state of a session as a ``CheckoutSession``."""
+
+    @abstractmethod
+    def construct_webhook_event(self, payload, sig_header):
+        """Return the event sent to the webhook as a dict-like object."""
+
+
+class StripeGateway(PaymentGateway):
+    """Stripe Checkout through one ``StripeClient`` per process.
+
+    The client keeps a pooled ``requests`` session, so connections to the
+    API are reused, and gives up after ``connect_timeout``/``read_timeout``
+    seconds and ``max_network_retries`` retries instead of Stripe's
+    80 second default.
+    """
+
+    def __init__(
+        self,
+        api_key=None,
+        webhook_secret=None,
+        connect_timeout=2.0,
+        read_timeout=10.0,
+        max_network_retries=2,
+        pool_size=20,
+        **breaker_options,
+    ):
+        super().__init__(**breaker_options)
+        self.api_key = api_key or settings.STRIPE_SECRET_KEY
+        self.webhook_secret = webhook_secret or settings.STRIPE_WEBHOOK_SECRET
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_network_retries = max_network_retries
+        self.pool_size = pool_size
+
+    @cached_property
+    def client(self):
+        import requests
+        import stripe
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.pool_size
+        )
+        session.mount("https://", adapter)
+        return stripe.StripeClient(
+            self.api_key,
+            http_client=stripe.RequestsClient(timeout=self.timeout, session=session),
+            max_network_retries=self.max_network_retries,
+        )
+
+    @contextmanager
+    def translate_errors(self):
+        import stripe
+
+        try:
+            yield
+        except (
+            stripe.APIConnectionError,
+            stripe.RateLimitError,
+            stripe.APIError,
+        ) as e:
+            raise RetryableGatewayError(str(e)) from e
+        except stripe.StripeError as e:
+            raise GatewayError(str(e)) from e
+
+    @staticmethod
+    def to_checkout_session(session):
+        return CheckoutSession(
+            id=session.id, url=session.url, payment_status=session.payment_status
+        )
+
+    def create_checkout_session(
+        self,
+        *,
+        product_name,
+        amount,
+        success_url,
+        cancel_url,
+        expires_at=None,
+        currency="usd",
+    ):
+        params = {
+            "line_items": [
+                {
+                    "price_data": {
+                        "currency": currency,
+                        "product_data": {"name": product_name},
+                        "unit_amount": int(amount * 100),
+                    },
+                    "quantity": 1,
+                }
+            ],
+            "mode": "payment",
+            "success_url": success_url,
+            "cancel_url": cancel_url,
+        }
+        if expires_at is not None:
+            params["expires_at"] = int(expires_at.timestamp())
+
+        with self.guarded("create_checkout_session"), self.translate_errors():
+            session = self.client.v1.checkout.sessions.create(params=params)
+        return self.to_checkout_session(session)
+
+    def retrieve_checkout_session(self, session_id):
+        with self.guarded("retrieve_checkout_session"), self.translate_errors():
+            session = self.client.v1.checkout.sessions.retrieve(session_id)
+        return self.to_checkout_session(session)
+
+    def construct_webhook_event(self, payload, sig_header):
+        import stripe
+
+        try:
+            return stripe.Webhook.construct_event(
+                payload, sig_header, self.webhook_secret
+            )
+        except (ValueError, stripe.SignatureVerificationError) as e:
+            raise InvalidWebhookError(str(e)) from e
+
+
+class FakeGateway(PaymentGateway):
+    """In-process gateway: sessions are paid once retrieved, webhooks unsigned.
+
+    Every call sleeps ``latency`` seconds and then fails with
+    ``RetryableGatewayError`` with probability ``failure_rate``.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None, **breaker_options):
+        super().__init__(**breaker_options)
+        self.latency = float(latency)
+        self.failure_rate = float(failure_rate)
+        self.random = random.Random(seed)
+
+    def simulate_call(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise RetryableGatewayError("Simulated payment gateway failure.")
+
+    @staticmethod
+    def session_url(session_id):
+        return f"https://checkout.stripe.test/pay/{session_id}"
+
+    def create_checkout_session(
+        self,
+        *,
+        product_name,
+        amount,
+        success_url,
+        cancel_url,
+        expires_at=None,
+        currency="usd",
+    ):
+        with self.guarded("create_checkout_session"):
+            self.simulate_call()
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        return CheckoutSession(
+            id=session_id, url=self.session_url(session_id), payment_status="unpaid"
+        )
+
+    def retrieve_checkout_session(self, session_id):
+        with self.guarded("retrieve_checkout_session"):
+            self.simulate_call()
+        return CheckoutSession(
+            id=session_id, url=self.session_url(session_id), payment_status="paid"
+        )
+
+    def construct_webhook_event(self, payload, sig_header):
+        try:
+            return json.loads(payload)
+        except ValueError as e:
+            raise InvalidWebhookError(str(e)) from e
+
+
+@lru_cache(maxsize=None)
+def get_gateway():
+    config = settings.PAYMENT_GATEWAY
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+
+@receiver(setting_changed)
+def reset_gateway(*, setting, **kwargs):
+    if setting in ("PAYMENT_GATEWAY", "STRIPE_SECRET_KEY", "STRIPE_WEBHOOK_SECRET"):
+        get_gateway.cache_clear()
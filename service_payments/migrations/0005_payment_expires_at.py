@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("service_borrowing", "0003_borrowing_active_indexes"),
+        ("service_payments", "0004_payment_created_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["status", "expires_at"], name="payment_status_expires_idx"
+            ),
+        ),
+    ]
@@ -1,10 +1,63 @@
-from django.db import models
+from collections import Counter
 
+from django.db import models, transaction
+from django.utils import timezone
+
+from service_book.models import Book
 from service_borrowing.models import Borrowing
 
 
+class PaymentQuerySet(models.QuerySet):
+    def expire(self):
+        """Mark unpaid payments EXPIRED and give back the books they held.
+
+        Borrowings whose checkout expired are closed (``actual_return_date``
+        set to today) so a later return can not release the copy twice.
+        Fines have no reserved copy and are only marked expired.
+        """
+        unpaid = [Payment.StatusChoices.INITIALIZING, Payment.StatusChoices.PENDING]
+
+        with transaction.atomic():
+            payments = list(
+                self.filter(status__in=unpaid)
+                .select_for_update()
+                .values_list("id", "type", "borrowing_id")
+            )
+            if not payments:
+                return 0
+
+            Payment.objects.filter(id__in=[payment[0] for payment in payments]).update(
+                status=Payment.StatusChoices.EXPIRED
+            )
+
+            held_borrowings = list(
+                Borrowing.objects.select_for_update()
+                .filter(
+                    id__in=[
+                        borrowing_id
+                        for _, payment_type, borrowing_id in payments
+                        if payment_type == Payment.TypeChoices.PAYMENT
+                    ],
+                    actual_return_date__isnull=True,
+                )
+                .order_by("id")
+                .values_list("id", "book_id")
+            )
+            if held_borrowings:
+                Borrowing.objects.filter(
+                    id__in=[borrowing_id for borrowing_id, _ in held_borrowings]
+                ).update(actual_return_date=timezone.now().date())
+
+                Book.objects.release_many(
+                    Counter(book_id for _, book_id in held_borrowings)
+                )
+
+        return len(payments)
+
+
 class Payment(models.Model):
     class StatusChoices(models.TextChoices):
+        INITIALIZING = "INITIALIZING"
         PENDING = "PENDING"
         PAID = "PAID"
         EXPIRED = "EXPIRED"
@@ -14,7 +67,7 @@ class Payment(models.Model):
         FINE = "FINE"
 
     status = models.CharField(
-        max_length=7,
+        max_length=12,
         choices=StatusChoices.choices,
         default=StatusChoices.PENDING,
     )
@@ -26,12 +79,50 @@ class Payment(models.Model):
     borrowing = models.ForeignKey(
         Borrowing, on_delete=models.CASCADE, related_name="payments"
     )
-    session_url = models.URLField(max_length=200)
-    session_id = models.CharField(max_length=255, blank=True, null=True)
+    session_url = models.URLField(max_length=200, blank=True)
+    session_id = models.CharField(max_length=255, blank=True, null=True, unique=True)
     money_to_pay = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # When the checkout session stops accepting payments.
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    objects = PaymentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "created_at"], name="payment_status_created_idx"
+            ),
+            models.Index(
+                fields=["status", "expires_at"], name="payment_status_expires_idx"
+            ),
+        ]
 
     def __str__(self):
         return (
             f"[{self.get_status_display()}] {self.get_type_display()} "
             f"Borrow: #{self.borrowing.id}"
         )
+
+
+class StripeEvent(models.Model):
+    """A received Stripe webhook event; the unique event id deduplicates retries."""
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=255)
+    session_id = models.CharField(max_length=255)
+    payment_status = models.CharField(max_length=255, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="stripe_event_unprocessed_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.type} ({self.event_id})"
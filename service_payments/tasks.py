@@ -0,0 +1,200 @@
+import logging
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from notifications.outbox import notify_many
+from service_payments.gateways import (
+    CircuitOpenError,
+    GatewayError,
+    RetryableGatewayError,
+    get_gateway,
+)
+from service_payments.models import Payment, StripeEvent
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_BATCH_SIZE = 500
+EXPIRY_CHUNK_SIZE = 500
+PAID_EVENT_TYPES = (
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
+)
+EXPIRED_EVENT_TYPES = ("checkout.session.expired",)
+WEBHOOK_EVENT_TYPES = PAID_EVENT_TYPES + EXPIRED_EVENT_TYPES
+
+
+def refund_needed_message(payment_id, borrowing_id, money_to_pay):
+    return (
+        f"⚠️ Refund needed!\nPayment ID: {payment_id} was paid after "
+        f"it expired.\nBorrow ID: {borrowing_id}\nTotal: ${money_to_pay}"
+    )
+
+
+@shared_task(bind=True, max_retries=5)
+def create_checkout_session(self, payment_id, success_url, cancel_url):
+    payment = (
+        Payment.objects.select_related("borrowing__book")
+        .filter(id=payment_id, status=Payment.StatusChoices.INITIALIZING)
+        .first()
+    )
+    if payment is None:
+        return f"Payment {payment_id} is not waiting for a checkout session."
+
+    expires_at = timezone.now() + settings.STRIPE_CHECKOUT_SESSION_LIFETIME
+    try:
+        session = get_gateway().create_checkout_session(
+            product_name=f"Rent book: {payment.borrowing.book.title}",
+            amount=payment.money_to_pay,
+            success_url=success_url,
+            cancel_url=cancel_url,
+            expires_at=expires_at,
+        )
+    except CircuitOpenError as e:
+        # Keep the checkout queued while the gateway is degraded; it is not
+        # attempted, so it does not use up retries. Payments left waiting
+        # too long are expired by expire_stale_payments.
+        raise self.retry(exc=e, countdown=e.retry_after, max_retries=None)
+    except RetryableGatewayError as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=2**self.request.retries)
+        Payment.objects.filter(id=payment_id).expire()
+        raise
+    except GatewayError:
+        Payment.objects.filter(id=payment_id).expire()
+        raise
+
+    Payment.objects.filter(
+        id=payment_id, status=Payment.StatusChoices.INITIALIZING
+    ).update(
+        session_id=session.id,
+        session_url=session.url,
+        expires_at=expires_at,
+        status=Payment.StatusChoices.PENDING,
+    )
+    return f"Checkout session {session.id} created for payment {payment_id}."
+
+
+@shared_task
+def process_stripe_events(batch_size=WEBHOOK_BATCH_SIZE):
+    """Apply stored webhook events to their payments, a batch at a time.
+
+    Each batch is claimed with ``skip_locked`` so several workers can drain
+    the queue together, and settled with one ``bulk_update`` for paid
+    sessions and one ``expire()`` for expired ones.
+    """
+    processed = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                StripeEvent.objects.select_for_update(skip_locked=True)
+                .filter(processed_at__isnull=True)
+                .order_by("id")[:batch_size]
+            )
+            if not events:
+                break
+
+            paid_sessions = {
+                event.session_id
+                for event in events
+                if event.type in PAID_EVENT_TYPES and event.payment_status == "paid"
+            }
+            expired_sessions = {
+                event.session_id
+                for event in events
+                if event.type in EXPIRED_EVENT_TYPES
+            }
+
+            payments = list(
+                Payment.objects.select_for_update()
+                .filter(
+                    session_id__in=paid_sessions,
+                    status=Payment.StatusChoices.PENDING,
+                )
+                .only("id", "status", "borrowing_id", "money_to_pay")
+            )
+            for payment in payments:
+                payment.status = Payment.StatusChoices.PAID
+            Payment.objects.bulk_update(payments, ["status"])
+
+            if expired_sessions:
+                Payment.objects.filter(session_id__in=expired_sessions).expire()
+
+            # The copy of an expired payment is already released, so money
+            # that arrives afterwards has to be refunded by hand.
+            late_payments = list(
+                Payment.objects.filter(
+                    session_id__in=paid_sessions,
+                    status=Payment.StatusChoices.EXPIRED,
+                ).values_list("id", "borrowing_id", "money_to_pay")
+            )
+            for payment_id, _, _ in late_payments:
+                logger.error(
+                    "Payment %s was paid after it expired and needs a refund.",
+                    payment_id,
+                )
+
+            StripeEvent.objects.filter(id__in=[event.id for event in events]).update(
+                processed_at=timezone.now()
+            )
+
+            notify_many(
+                (
+                    f"✅ Payment success!\nBorrow ID: {payment.borrowing_id}\n"
+                    f"Total: ${payment.money_to_pay}"
+                    for payment in payments
+                ),
+                kind="payment_succeeded",
+            )
+            notify_many(
+                (refund_needed_message(*payment) for payment in late_payments),
+                kind="payment_refund_needed",
+            )
+
+        processed += len(events)
+
+    return f"Processed {processed} Stripe events."
+
+
+@shared_task
+def expire_stale_payments(chunk_size=EXPIRY_CHUNK_SIZE):
+    """Expire checkout payments that outlived their Stripe session.
+
+    A session counts as stale ``STRIPE_CHECKOUT_EXPIRY_GRACE`` after its
+    ``expires_at``, leaving time for a payment made at the last moment to
+    arrive. Payments that never got a session are measured from creation.
+
+    Works in chunks claimed with ``skip_locked``, so overlapping runs on
+    several workers split the backlog instead of waiting on each other.
+    Fines are left alone: they are owed whether or not a session exists.
+    """
+    cutoff = timezone.now() - settings.STRIPE_CHECKOUT_EXPIRY_GRACE
+    stale = Payment.objects.filter(
+        Q(expires_at__lt=cutoff)
+        | Q(
+            expires_at__isnull=True,
+            created_at__lt=cutoff - settings.STRIPE_CHECKOUT_SESSION_LIFETIME,
+        ),
+        status__in=[
+            Payment.StatusChoices.INITIALIZING,
+            Payment.StatusChoices.PENDING,
+        ],
+        type=Payment.TypeChoices.PAYMENT,
+    )
+
+    expired = 0
+    while True:
+        with transaction.atomic():
+            payment_ids = list(
+                stale.select_for_update(skip_locked=True)
+                .order_by("created_at")
+                .values_list("id", flat=True)[:chunk_size]
+            )
+            if not payment_ids:
+                break
+            expired += Payment.objects.filter(id__in=payment_ids).expire()
+
+    return f"Expired {expired} stale payments."
@@ -1,21 +1,45 @@
 import datetime
+import decimal
+import hashlib
+import hmac
+import json
+import time
 from unittest.mock import patch, MagicMock
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
 
+from Library_Service.throttling import ActionScopedRedisThrottle
+from notifications.models import OutboxMessage
+from notifications.outbox import NOTIFY_HANDLER
 from service_book.models import Book
 from service_borrowing.models import Borrowing
-from service_payments.models import Payment
+from service_payments.gateways import (
+    CircuitBreaker,
+    CircuitOpenError,
+    FakeGateway,
+    InvalidWebhookError,
+    PaymentGateway,
+    RetryableGatewayError,
+)
+from service_payments.models import Payment, StripeEvent
+from service_payments.tasks import expire_stale_payments, process_stripe_events
 
 User = get_user_model()
 
 PAYMENTS_URL = reverse("service_payments:payment-list")
 PAYMENT_SUCCESS_URL = reverse("service_payments:payment-success")
 PAYMENT_CANCEL_URL = reverse("service_payments:payment-cancel")
+PAYMENT_EXPORT_URL = reverse("service_payments:payment-export")
+PAYMENT_WEBHOOK_URL = reverse("service_payments:payment-webhook")
+PAYMENT_GATEWAY_STATUS_URL = reverse("service_payments:payment-gateway-status")
+WEBHOOK_SECRET = "whsec_test_secret"
 
 
 def detail_url(payment_id):
@@ -62,6 +86,29 @@ def create_sample_payment(borrowing, **params):
     return Payment.objects.create(borrowing=borrowing, **defaults)
 
 
+def checkout_event(event_id, event_type, session_id, payment_status="paid"):
+    return {
+        "id": event_id,
+        "object": "event",
+        "type": event_type,
+        "data": {
+            "object": {
+                "id": session_id,
+                "object": "checkout.session",
+                "payment_status": payment_status,
+            }
+        },
+    }
+
+
+def sign_payload(payload, secret=WEBHOOK_SECRET):
+    timestamp = int(time.time())
+    signature = hmac.new(
+        secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256
+    ).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
 class PaymentApiTests(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -101,16 +148,16 @@ class PaymentApiTests(APITestCase):
         res = self.client.get(PAYMENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]["id"], self.payment_user.id)
-        self.assertEqual(res.data[0]["money_to_pay"], "20.00")
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertEqual(res.data["results"][0]["id"], self.payment_user.id)
+        self.assertEqual(res.data["results"][0]["money_to_pay"], "20.00")
 
     def test_admin_user_sees_all_payments_list(self):
         self.client.force_authenticate(user=self.admin_user)
         res = self.client.get(PAYMENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 2)
+        self.assertEqual(len(res.data["results"]), 2)
 
     def test_regular_user_can_retrieve_own_payment(self):
         self.client.force_authenticate(user=self.user)
@@ -132,7 +179,7 @@ class PaymentApiTests(APITestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data["id"], self.payment_user.id)
 
-    @patch("service_payments.views.stripe.checkout.Session.retrieve")
+    @patch("service_payments.gateways.StripeGateway.retrieve_checkout_session")
     def test_payment_success_action_updates_status(self, mock_stripe_retrieve):
 
         mock_stripe_retrieve.return_value = MagicMock(payment_status="paid")
@@ -152,7 +199,7 @@ class PaymentApiTests(APITestCase):
         self.payment_user.refresh_from_db()
         self.assertEqual(self.payment_user.status, Payment.StatusChoices.PAID)
 
-    @patch("service_payments.views.stripe.checkout.Session.retrieve")
+    @patch("service_payments.gateways.StripeGateway.retrieve_checkout_session")
     def test_payment_success_action_not_paid(self, mock_stripe_retrieve):
         mock_stripe_retrieve.return_value = MagicMock(payment_status="pending")
         self.client.force_authenticate(user=self.user)
@@ -165,7 +212,7 @@ class PaymentApiTests(APITestCase):
         self.payment_user.refresh_from_db()
         self.assertEqual(self.payment_user.status, Payment.StatusChoices.PENDING)
 
-    @patch("service_payments.views.stripe.checkout.Session.retrieve")
+    @patch("service_payments.gateways.StripeGateway.retrieve_checkout_session")
     def test_payment_success_action_payment_not_found(self, mock_stripe_retrieve):
         mock_stripe_retrieve.return_value = MagicMock(payment_status="paid")
         self.client.force_authenticate(user=self.user)
@@ -176,6 +223,63 @@ class PaymentApiTests(APITestCase):
         self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
         self.assertIn("Payment not found", res.data["error"])
 
+    @patch("service_payments.gateways.StripeGateway.retrieve_checkout_session")
+    def test_payment_success_action_requires_session_id(self, mock_retrieve):
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(PAYMENT_SUCCESS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        mock_retrieve.assert_not_called()
+
+    @patch("service_payments.gateways.StripeGateway.retrieve_checkout_session")
+    def test_payment_success_action_keeps_expired_payment(self, mock_retrieve):
+        mock_retrieve.return_value = MagicMock(payment_status="paid")
+        Payment.objects.filter(id=self.payment_user.id).update(
+            status=Payment.StatusChoices.EXPIRED
+        )
+        self.client.force_authenticate(user=self.user)
+
+        url = f"{PAYMENT_SUCCESS_URL}?session_id={self.payment_user.session_id}"
+        with self.assertLogs("service_payments.views", "ERROR"):
+            res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.payment_user.refresh_from_db()
+        self.assertEqual(self.payment_user.status, Payment.StatusChoices.EXPIRED)
+        message = OutboxMessage.objects.get(handler=NOTIFY_HANDLER)
+        self.assertEqual(message.payload["kind"], "payment_refund_needed")
+
+    @patch("service_payments.gateways.StripeGateway.retrieve_checkout_session")
+    def test_payment_success_action_gateway_unavailable(self, mock_retrieve):
+        mock_retrieve.side_effect = CircuitOpenError(retry_after=12)
+        self.client.force_authenticate(user=self.user)
+
+        url = f"{PAYMENT_SUCCESS_URL}?session_id={self.payment_user.session_id}"
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res["Retry-After"], "12")
+
+    @override_settings(
+        PAYMENT_GATEWAY={"BACKEND": "service_payments.gateways.FakeGateway"}
+    )
+    def test_gateway_status_for_admin_only(self):
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(
+            self.client.get(PAYMENT_GATEWAY_STATUS_URL).status_code,
+            status.HTTP_403_FORBIDDEN,
+        )
+
+        self.client.force_authenticate(user=self.admin_user)
+        url = f"{PAYMENT_SUCCESS_URL}?session_id={self.payment_user.session_id}"
+        self.client.get(url)
+        res = self.client.get(PAYMENT_GATEWAY_STATUS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["circuit"]["state"], CircuitBreaker.CLOSED)
+        self.assertEqual(res.data["calls"]["retrieve_checkout_session"]["count"], 1)
+
     def test_payment_cancel_action(self):
         self.client.force_authenticate(user=self.user)
         res = self.client.get(PAYMENT_CANCEL_URL)
@@ -201,3 +305,344 @@ class PaymentApiTests(APITestCase):
 
         self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(Payment.objects.count(), payment_count)
+
+    def test_admin_can_export_payments_as_ndjson(self):
+        self.client.force_authenticate(user=self.admin_user)
+
+        res = self.client.get(PAYMENT_EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Content-Type"], "application/x-ndjson")
+        rows = [
+            json.loads(line)
+            for line in b"".join(res.streaming_content).decode().splitlines()
+        ]
+        self.assertEqual(
+            rows,
+            [
+                self.client.get(detail_url(payment.id)).data
+                for payment in (self.payment_user, self.payment_admin)
+            ],
+        )
+
+
+@override_settings(
+    PAYMENT_GATEWAY={
+        "BACKEND": "service_payments.gateways.StripeGateway",
+        "OPTIONS": {"webhook_secret": WEBHOOK_SECRET},
+    }
+)
+class StripeWebhookTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="user@test.com", password="testpassword123"
+        )
+        self.book = create_sample_book(inventory=5)
+        self.paid_payment = create_sample_payment(
+            create_sample_borrowing(self.user, self.book),
+            session_id="cs_paid",
+        )
+        self.expired_payment = create_sample_payment(
+            create_sample_borrowing(self.user, self.book),
+            session_id="cs_expired",
+        )
+
+    def post_event(self, event, signature=None):
+        payload = json.dumps(event)
+        return self.client.post(
+            PAYMENT_WEBHOOK_URL,
+            data=payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=signature or sign_payload(payload),
+        )
+
+    def test_webhook_rejects_bad_signature(self):
+        event = checkout_event("evt_1", "checkout.session.completed", "cs_paid")
+
+        res = self.post_event(event, signature=sign_payload("{}", "whsec_other"))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_webhook_stores_each_event_once(self):
+        event = checkout_event("evt_1", "checkout.session.completed", "cs_paid")
+
+        first = self.post_event(event)
+        second = self.post_event(event)
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        self.assertEqual(
+            OutboxMessage.objects.filter(
+                handler="service_payments.tasks.process_stripe_events"
+            ).count(),
+            1,
+        )
+
+    @patch.dict(
+        ActionScopedRedisThrottle.THROTTLE_RATES,
+        {"anon": "1/minute", "payment_callback": "1/minute"},
+    )
+    def test_webhook_is_not_throttled(self):
+        cache.clear()
+        event = checkout_event("evt_1", "checkout.session.completed", "cs_paid")
+
+        responses = [self.post_event(event) for _ in range(2)]
+
+        self.assertEqual(
+            [res.status_code for res in responses], [status.HTTP_200_OK] * 2
+        )
+        self.client.force_authenticate(self.user)
+        self.client.get(PAYMENT_SUCCESS_URL)
+        self.assertEqual(
+            self.client.get(PAYMENT_SUCCESS_URL).status_code,
+            status.HTTP_429_TOO_MANY_REQUESTS,
+        )
+
+    def test_webhook_ignores_other_event_types(self):
+        event = checkout_event("evt_1", "payment_intent.created", "pi_1")
+
+        res = self.post_event(event)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_process_events_settles_payments_in_one_batch(self):
+        for event in (
+            checkout_event("evt_1", "checkout.session.completed", "cs_paid"),
+            checkout_event("evt_2", "checkout.session.completed", "cs_paid"),
+            checkout_event("evt_3", "checkout.session.expired", "cs_expired", "unpaid"),
+            checkout_event("evt_4", "checkout.session.completed", "cs_unknown"),
+        ):
+            self.post_event(event)
+
+        process_stripe_events()
+
+        self.paid_payment.refresh_from_db()
+        self.expired_payment.refresh_from_db()
+        self.book.refresh_from_db()
+        self.assertEqual(self.paid_payment.status, Payment.StatusChoices.PAID)
+        self.assertEqual(self.expired_payment.status, Payment.StatusChoices.EXPIRED)
+        self.assertEqual(self.book.inventory, 6)
+        self.assertFalse(StripeEvent.objects.filter(processed_at__isnull=True).exists())
+        self.assertEqual(
+            OutboxMessage.objects.filter(handler=NOTIFY_HANDLER).count(), 1
+        )
+
+    def test_payment_after_expiry_is_flagged_for_refund(self):
+        self.expired_payment.status = Payment.StatusChoices.EXPIRED
+        self.expired_payment.save()
+        self.post_event(
+            checkout_event("evt_1", "checkout.session.completed", "cs_expired")
+        )
+
+        with self.assertLogs("service_payments.tasks", "ERROR"):
+            process_stripe_events()
+
+        self.expired_payment.refresh_from_db()
+        self.assertEqual(self.expired_payment.status, Payment.StatusChoices.EXPIRED)
+        message = OutboxMessage.objects.get(handler=NOTIFY_HANDLER)
+        self.assertEqual(message.payload["kind"], "payment_refund_needed")
+        self.assertIn(
+            f"Payment ID: {self.expired_payment.id}", message.payload["message"]
+        )
+
+    def test_success_redirect_skips_stripe_after_webhook(self):
+        self.post_event(
+            checkout_event("evt_1", "checkout.session.completed", "cs_paid")
+        )
+        process_stripe_events()
+        self.client.force_authenticate(user=self.user)
+
+        with patch(
+            "service_payments.gateways.StripeGateway.retrieve_checkout_session"
+        ) as retrieve:
+            res = self.client.get(f"{PAYMENT_SUCCESS_URL}?session_id=cs_paid")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        retrieve.assert_not_called()
+
+
+class ExpireStalePaymentsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="user@test.com", password="testpassword123"
+        )
+        self.book = create_sample_book(inventory=5)
+        self.long_ago = timezone.now() - datetime.timedelta(days=2)
+
+    def create_payment(self, session_id, created_at=None, **params):
+        payment = create_sample_payment(
+            create_sample_borrowing(self.user, self.book),
+            session_id=session_id,
+            **params,
+        )
+        if created_at is not None:
+            Payment.objects.filter(id=payment.id).update(created_at=created_at)
+        return payment
+
+    def test_expires_stale_checkouts_in_chunks(self):
+        stale = [self.create_payment(f"cs_stale_{i}", self.long_ago) for i in range(3)]
+        fresh = self.create_payment("cs_fresh")
+        paid = self.create_payment(
+            "cs_paid", self.long_ago, status=Payment.StatusChoices.PAID
+        )
+        fine = self.create_payment(
+            "cs_fine", self.long_ago, type=Payment.TypeChoices.FINE
+        )
+
+        result = expire_stale_payments(chunk_size=2)
+
+        self.assertEqual(result, "Expired 3 stale payments.")
+        self.assertEqual(
+            set(
+                Payment.objects.filter(
+                    status=Payment.StatusChoices.EXPIRED
+                ).values_list("id", flat=True)
+            ),
+            {payment.id for payment in stale},
+        )
+        for payment, expected in (
+            (fresh, Payment.StatusChoices.PENDING),
+            (paid, Payment.StatusChoices.PAID),
+            (fine, Payment.StatusChoices.PENDING),
+        ):
+            payment.refresh_from_db()
+            self.assertEqual(payment.status, expected)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 8)
+        self.assertEqual(
+            Borrowing.objects.filter(actual_return_date__isnull=False).count(), 3
+        )
+
+    def test_sessions_are_expired_only_after_the_grace_period(self):
+        now = timezone.now()
+        grace = settings.STRIPE_CHECKOUT_EXPIRY_GRACE
+        in_grace = self.create_payment(
+            "cs_in_grace", expires_at=now - grace + datetime.timedelta(minutes=5)
+        )
+        past_grace = self.create_payment(
+            "cs_past_grace", expires_at=now - grace - datetime.timedelta(minutes=5)
+        )
+        # Created long ago, but its session was only opened recently.
+        late_session = self.create_payment(
+            "cs_late", self.long_ago, expires_at=now + datetime.timedelta(hours=1)
+        )
+
+        self.assertEqual(expire_stale_payments(), "Expired 1 stale payments.")
+
+        for payment, expected in (
+            (in_grace, Payment.StatusChoices.PENDING),
+            (past_grace, Payment.StatusChoices.EXPIRED),
+            (late_session, Payment.StatusChoices.PENDING),
+        ):
+            payment.refresh_from_db()
+            self.assertEqual(payment.status, expected)
+
+    def test_nothing_to_expire(self):
+        self.create_payment("cs_fresh")
+
+        self.assertEqual(expire_stale_payments(), "Expired 0 stale payments.")
+
+
+class PaymentGatewayTests(SimpleTestCase):
+    def test_incomplete_gateway_fails_when_built(self):
+        class HalfGateway(PaymentGateway):
+            def create_checkout_session(self, **kwargs):
+                pass
+
+        with self.assertRaisesMessage(TypeError, "retrieve_checkout_session"):
+            HalfGateway()
+
+
+class FakeGatewayTests(SimpleTestCase):
+    def create_session(self, gateway):
+        return gateway.create_checkout_session(
+            product_name="Rent book: Sample Book",
+            amount=decimal.Decimal("6.00"),
+            success_url="http://testserver/success",
+            cancel_url="http://testserver/cancel",
+        )
+
+    def test_sessions_are_paid_once_retrieved(self):
+        gateway = FakeGateway()
+
+        session = self.create_session(gateway)
+
+        self.assertTrue(session.id.startswith("cs_test_"))
+        self.assertEqual(session.payment_status, "unpaid")
+        self.assertEqual(
+            gateway.retrieve_checkout_session(session.id).payment_status, "paid"
+        )
+
+    def test_failure_rate_raises_retryable_errors(self):
+        gateway = FakeGateway(failure_rate=0.5, seed=1, failure_threshold=1000)
+
+        outcomes = []
+        for _ in range(200):
+            try:
+                self.create_session(gateway)
+                outcomes.append(True)
+            except RetryableGatewayError:
+                outcomes.append(False)
+
+        self.assertGreater(outcomes.count(False), 50)
+        self.assertGreater(outcomes.count(True), 50)
+
+    @patch("service_payments.gateways.time.sleep")
+    def test_latency_is_simulated_per_call(self, mock_sleep):
+        gateway = FakeGateway(latency=0.2)
+
+        gateway.retrieve_checkout_session("cs_test_1")
+
+        mock_sleep.assert_called_once_with(0.2)
+
+    def test_circuit_opens_after_failures_and_recovers(self):
+        gateway = FakeGateway(failure_rate=1.0, failure_threshold=2, reset_timeout=30)
+
+        for _ in range(2):
+            with self.assertRaises(RetryableGatewayError):
+                gateway.retrieve_checkout_session("cs_test_1")
+        with patch.object(gateway, "simulate_call") as simulate_call:
+            with self.assertRaises(CircuitOpenError):
+                gateway.retrieve_checkout_session("cs_test_1")
+            simulate_call.assert_not_called()
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.OPEN)
+
+        gateway.failure_rate = 0.0
+        with patch(
+            "service_payments.gateways.time.monotonic",
+            return_value=time.monotonic() + 31,
+        ):
+            gateway.retrieve_checkout_session("cs_test_1")
+
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(
+            gateway.status()["calls"]["retrieve_checkout_session"]["errors"], 2
+        )
+
+    def test_unexpected_error_in_trial_call_reopens_the_circuit(self):
+        gateway = FakeGateway(failure_rate=1.0, failure_threshold=1, reset_timeout=30)
+        with self.assertRaises(RetryableGatewayError):
+            gateway.retrieve_checkout_session("cs_test_1")
+        later = time.monotonic() + 31
+
+        with patch("service_payments.gateways.time.monotonic", return_value=later):
+            with patch.object(gateway, "simulate_call", side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    gateway.retrieve_checkout_session("cs_test_1")
+            self.assertEqual(gateway.breaker.state, CircuitBreaker.OPEN)
+
+        gateway.failure_rate = 0.0
+        with patch("service_payments.gateways.time.monotonic", return_value=later + 31):
+            gateway.retrieve_checkout_session("cs_test_1")
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(
+            gateway.status()["calls"]["retrieve_checkout_session"]["errors"], 2
+        )
+
+    def test_webhook_payload_must_be_json(self):
+        with self.assertRaises(InvalidWebhookError):
+            FakeGateway().construct_webhook_event(b"not json", "")
@@ -1,19 +1,33 @@
+import logging
+
+from django.db import transaction
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-import stripe
 
-from service_payments.models import Payment
+from Library_Service.exporting import ExportMixin
+from Library_Service.fast_read import FastReadListMixin
+from service_payments.gateways import (
+    CircuitOpenError,
+    InvalidWebhookError,
+    get_gateway,
+)
+from service_payments.models import Payment, StripeEvent
 from service_payments.serializers import PaymentSerializer
-from notifications.tasks import send_notification_task
+from service_payments.tasks import WEBHOOK_EVENT_TYPES, refund_needed_message
+from notifications.outbox import notify, publish
+
+logger = logging.getLogger(__name__)
 
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(ExportMixin, FastReadListMixin, viewsets.ModelViewSet):
+    export_name = "payments"
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scopes = {"success": "payment_callback", "cancel": "payment_callback"}
 
     @extend_schema(
         parameters=[
@@ -56,41 +70,134 @@ class PaymentViewSet(viewsets.ModelViewSet):
             queryset = Payment.objects.filter(borrowing__user=user)
         return queryset.select_related("borrowing", "borrowing__user")
 
+    @extend_schema(responses={200: OpenApiTypes.OBJECT})
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="gateway-status",
+        permission_classes=[IsAdminUser],
+    )
+    def gateway_status(self, request):
+        """Breaker state and call latencies of this process's gateway."""
+        return Response(get_gateway().status())
+
     @action(detail=False, methods=["get"], url_path="success")
     def success(self, request):
         session_id = request.query_params.get("session_id")
+        if not session_id:
+            return Response(
+                {"error": "The session_id query parameter is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        payment = Payment.objects.filter(session_id=session_id).first()
+        if payment is not None and payment.status == Payment.StatusChoices.PAID:
+            # Already confirmed by the webhook, no need to ask Stripe again.
+            return Response(
+                {"message": f"Payment {payment.id} successful!"},
+                status=status.HTTP_200_OK,
+            )
 
         try:
-            session = stripe.checkout.Session.retrieve(session_id)
+            session = get_gateway().retrieve_checkout_session(session_id)
 
-            if session.payment_status == "paid":
+            if session.payment_status != "paid":
+                return Response(
+                    {"message": "Payment not successful."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
 
+            with transaction.atomic():
+                # The webhook's transition: only a pending payment becomes
+                # paid, so one that expired meanwhile stays expired.
+                confirmed = Payment.objects.filter(
+                    session_id=session_id, status=Payment.StatusChoices.PENDING
+                ).update(status=Payment.StatusChoices.PAID)
                 payment = Payment.objects.get(session_id=session_id)
-                payment.status = Payment.StatusChoices.PAID
-                payment.save()
 
-                message = f"✅ Payment success!\nBorrow ID: {payment.borrowing.id}\nTotal: ${payment.money_to_pay}"
-                send_notification_task.delay(message)
+                if confirmed:
+                    message = f"✅ Payment success!\nBorrow ID: {payment.borrowing.id}\nTotal: ${payment.money_to_pay}"
+                    notify(message, kind="payment_succeeded")
+                elif payment.status == Payment.StatusChoices.EXPIRED:
+                    logger.error(
+                        "Payment %s was paid after it expired and needs a refund.",
+                        payment.id,
+                    )
+                    notify(
+                        refund_needed_message(
+                            payment.id, payment.borrowing_id, payment.money_to_pay
+                        ),
+                        kind="payment_refund_needed",
+                    )
 
+            if payment.status == Payment.StatusChoices.EXPIRED:
                 return Response(
-                    {"message": f"Payment {payment.id} successful!"},
-                    status=status.HTTP_200_OK,
-                )
-            else:
-                return Response(
-                    {"message": "Payment not successful."},
-                    status=status.HTTP_400_BAD_REQUEST,
+                    {
+                        "error": f"Payment {payment.id} expired before it was "
+                        "paid and will be refunded."
+                    },
+                    status=status.HTTP_409_CONFLICT,
                 )
+            return Response(
+                {"message": f"Payment {payment.id} successful!"},
+                status=status.HTTP_200_OK,
+            )
 
         except Payment.DoesNotExist:
             return Response(
                 {"error": "Payment not found."}, status=status.HTTP_404_NOT_FOUND
             )
+        except CircuitOpenError as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(e.retry_after)},
+            )
         except Exception as e:
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @extend_schema(request=OpenApiTypes.OBJECT, responses={200: OpenApiTypes.OBJECT})
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="webhook",
+        permission_classes=[AllowAny],
+        authentication_classes=[],
+        # Stripe retries rejected deliveries for days; the signature check
+        # is what keeps other callers out.
+        throttle_classes=[],
+    )
+    def webhook(self, request):
+        try:
+            event = get_gateway().construct_webhook_event(
+                request.body, request.headers.get("Stripe-Signature", "")
+            )
+        except InvalidWebhookError:
+            return Response(
+                {"error": "Invalid webhook payload or signature."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if event["type"] in WEBHOOK_EVENT_TYPES:
+            session = event["data"]["object"]
+            with transaction.atomic():
+                # Stripe retries deliveries; the unique event id drops
+                # duplicates.
+                _, created = StripeEvent.objects.get_or_create(
+                    event_id=event["id"],
+                    defaults={
+                        "type": event["type"],
+                        "session_id": session["id"],
+                        "payment_status": session.get("payment_status") or "",
+                    },
+                )
+                if created:
+                    publish("service_payments.tasks.process_stripe_events")
+
+        return Response({"received": True})
+
     @action(detail=False, methods=["get"], url_path="cancel")
     def cancel(self, request):
         return Response({"message": "Payment cancel."})
@@ -0,0 +1,59 @@
+"""JWT authentication that serves users from the cache.
+
+``JWTAuthentication`` loads the user by primary key on every request.
+Here the fields permission checks need are kept in the cache for
+``AUTH_USER_CACHE_TIMEOUT`` seconds, so repeated requests with a token cost
+no queries. The password hash is never cached; a hit returns a user with
+the other fields deferred, as ``QuerySet.only()`` would. Saving or deleting
+a user drops its entry (see ``user.signals``); the timeout bounds how long
+a change made with ``QuerySet.update()`` can go unnoticed.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+CACHED_FIELDS = ("id", "email", "is_active", "is_staff", "is_superuser")
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        key = user_cache_key(user_id)
+        cached = cache.get(key)
+        if cached is None:
+            user = super().get_user(validated_token)
+            cache.set(key, self.cache_entry(user), settings.AUTH_USER_CACHE_TIMEOUT)
+            return user
+
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != cached.get("password_hash"):
+            raise AuthenticationFailed(
+                _("The user's password has been changed."), code="password_changed"
+            )
+        return self.user_model.from_db(
+            router.db_for_read(self.user_model),
+            CACHED_FIELDS,
+            [cached[field] for field in CACHED_FIELDS],
+        )
+
+    def cache_entry(self, user):
+        entry = {field: getattr(user, field) for field in CACHED_FIELDS}
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # The token carries the same digest, so it reveals nothing new.
+            entry["password_hash"] = get_md5_hash_password(user.password)
+        return entry
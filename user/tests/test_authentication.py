@@ -0,0 +1,101 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from service_book.models import Book
+from user.authentication import user_cache_key
+
+BOOK_URL = reverse("service_book:book-list")
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="reader@test.com", password="testpass123"
+        )
+        Book.objects.create(title="Dune", author="Herbert", inventory=3, daily_fee=1)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+
+    def test_repeated_catalog_reads_cost_no_queries(self):
+        self.assertEqual(self.client.get(BOOK_URL).status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(BOOK_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_cache_holds_no_password_hash(self):
+        self.client.get(BOOK_URL)
+
+        self.assertEqual(
+            cache.get(user_cache_key(self.user.id)),
+            {
+                "id": self.user.id,
+                "email": "reader@test.com",
+                "is_active": True,
+                "is_staff": False,
+                "is_superuser": False,
+            },
+        )
+
+    def test_cached_user_defers_the_other_fields(self):
+        self.client.get(BOOK_URL)
+
+        res = self.client.get(BOOK_URL)
+        user = res.wsgi_request.user
+
+        self.assertEqual(user, self.user)
+        self.assertIn("password", user.get_deferred_fields())
+        self.assertFalse(user._state.adding)
+
+    @patch.object(api_settings, "CHECK_REVOKE_TOKEN", True)
+    def test_token_for_an_old_password_is_rejected_from_the_cache(self):
+        old_token = AccessToken.for_user(self.user)
+        self.user.set_password("newpass123")
+        self.user.save()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.client.get(BOOK_URL)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {old_token}")
+        with self.assertNumQueries(0):
+            res = self.client.get(BOOK_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_saving_the_user_drops_the_cached_copy(self):
+        self.client.get(BOOK_URL)
+
+        self.user.first_name = "Paul"
+        self.user.save()
+
+        self.assertIsNone(cache.get(user_cache_key(self.user.id)))
+
+    def test_deactivated_user_is_rejected_straight_away(self):
+        self.client.get(BOOK_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(BOOK_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user_is_rejected_straight_away(self):
+        self.client.get(BOOK_URL)
+
+        self.user.delete()
+        res = self.client.get(BOOK_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,65 @@
+from unittest.mock import patch
+
+import fakeredis
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from user.tests.test_user_api import create_user
+
+TOKEN_URL = reverse("user:login")
+BOOK_URL = reverse("service_book:book-list")
+LOGIN_KEY = "throttle_login_127.0.0.1"
+
+
+class ThrottleTestsMixin:
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+        self.user = create_user(email="reader@test.com", password="testpass123")
+        self.payload = {"email": "reader@test.com", "password": "wrong"}
+
+    def test_login_is_limited_per_client(self):
+        for _ in range(5):
+            res = self.client.post(TOKEN_URL, self.payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", res.headers)
+
+    def test_scopes_are_limited_separately(self):
+        for _ in range(6):
+            self.client.post(TOKEN_URL, self.payload)
+        self.client.force_authenticate(self.user)
+
+        res = self.client.get(BOOK_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+@override_settings(THROTTLE_REDIS_URL=None)
+class CacheThrottleTests(ThrottleTestsMixin, TestCase):
+    pass
+
+
+class RedisThrottleTests(ThrottleTestsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeRedis()
+        patcher = patch("Library_Service.throttling.get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_is_refilled_one_request_per_interval(self):
+        for _ in range(6):
+            res = self.client.post(TOKEN_URL, self.payload)
+
+        # 5/minute lets one more request in every 12 seconds.
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertLessEqual(int(res.headers["Retry-After"]), 12)
+        self.assertGreater(self.redis.pttl(LOGIN_KEY), 48_000)
@@ -1,9 +1,11 @@
 from django.urls import path
-from user.views import CreateUserView, ManageUserView, LoginUserView
+from rest_framework_simplejwt.views import TokenRefreshView
 
-from rest_framework_simplejwt.views import (
-   TokenObtainPairView,
-   TokenRefreshView,
+from user.views import (
+    CreateUserView,
+    ManageUserView,
+    LoginUserView,
+    TokenObtainView,
 )
 
 app_name = "user"
@@ -12,7 +14,6 @@ urlpatterns = [
     path("register/", CreateUserView.as_view(), name="create"),
     path("login/", LoginUserView.as_view(), name="login"),
     path("me/", ManageUserView.as_view(), name="manage"),
-    path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
+    path("api/token/", TokenObtainView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
-
 ]
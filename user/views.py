@@ -3,6 +3,7 @@ from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.settings import api_settings
+from rest_framework_simplejwt.views import TokenObtainPairView
 
 from user.serializers import UserSerializer, AuthTokenSerializer
 
@@ -15,6 +16,12 @@ class CreateUserView(generics.CreateAPIView):
 class LoginUserView(ObtainAuthToken):
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
     serializer_class = AuthTokenSerializer
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    throttle_scope = "login"
+
+
+class TokenObtainView(TokenObtainPairView):
+    throttle_scope = "login"
 
 
 class ManageUserView(generics.RetrieveUpdateAPIView):